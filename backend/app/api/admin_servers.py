@@ -1,17 +1,25 @@
 """Админские эндпоинты для CRUD по серверам."""
 import logging
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from pydantic import BaseModel, Field
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.api.etag import REVALIDATE_CACHE_CONTROL, etag_matches, make_etag, not_modified
 from app.dependencies.auth import AuthContext, require_admin
-from app.db import get_session
+from app.dependencies.concurrency import concurrency_slot
+from app.db import get_read_session, get_session
+from app.services.concurrency import GROUP_INTERNAL
+from app.services.read_routing import SERVERS_KEY, recent_writes
 from app.services.server_service import ServerNotFound, ServerService
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/admin/servers", tags=["admin"])
+router = APIRouter(
+    prefix="/api/admin/servers",
+    tags=["admin"],
+    dependencies=[Depends(concurrency_slot(GROUP_INTERNAL))],
+)
 
 
 class ServerBase(BaseModel):
@@ -56,13 +64,22 @@ class ServerResponse(ServerBase):
 
 @router.get("", response_model=list[ServerResponse], summary="Список всех серверов")
 async def list_servers(
+    request: Request,
+    response: Response,
     admin: AuthContext = Depends(require_admin),
-    session: AsyncSession = Depends(get_session),
-) -> list[ServerResponse]:
+    session: AsyncSession = Depends(get_read_session),
+) -> list[ServerResponse] | Response:
+    recent_writes.route(session, SERVERS_KEY)
     service = ServerService(session)
     servers = await service.list_servers()
     logger.info("Админ запросил список серверов", extra={"tg_id": admin.tg_id})
-    return [ServerResponse.model_validate(server) for server in servers]
+    items = [ServerResponse.model_validate(server) for server in servers]
+    etag = make_etag([item.model_dump(mode="json") for item in items])
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+    return items
 
 
 @router.post("", response_model=ServerResponse, status_code=status.HTTP_201_CREATED, summary="Создать сервер")
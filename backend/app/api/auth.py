@@ -1,13 +1,16 @@
 """Маршруты для аутентификации через Telegram Mini App."""
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
 from app.db import get_session
-from app.services.auth_service import AuthResult, AuthService
+from app.dependencies.concurrency import concurrency_slot
+from app.services.auth_service import AuthError, AuthResult, AuthService
+from app.services.concurrency import GROUP_CLIENT
+from app.services.session_tokens import issue_session_token
 
-router = APIRouter(prefix="/api/auth", tags=["auth"])
+router = APIRouter(prefix="/api/auth", tags=["auth"], dependencies=[Depends(concurrency_slot(GROUP_CLIENT))])
 
 
 class TelegramAuthRequest(BaseModel):
@@ -17,6 +20,8 @@ class TelegramAuthRequest(BaseModel):
 class TelegramAuthResponse(BaseModel):
     tg_id: int
     role: str
+    session_token: str
+    session_expires_at: int
 
 
 @router.post("/telegram", response_model=TelegramAuthResponse, summary="Аутентификация Telegram WebApp")
@@ -24,7 +29,27 @@ async def auth_telegram(
     payload: TelegramAuthRequest,
     session: AsyncSession = Depends(get_session),
 ) -> TelegramAuthResponse:
-    """Проверить initData, создать пользователя при необходимости и вернуть роль."""
-    service = AuthService(session=session, bot_token=settings.bot_token, admin_tg_ids=settings.admin_tg_ids)
-    result: AuthResult = await service.authenticate(payload.initData)
-    return TelegramAuthResponse(tg_id=result.user.tg_id, role=result.role)
+    """Проверить initData, создать пользователя при необходимости и вернуть роль и сессионный токен."""
+    service = AuthService(
+        session=session,
+        bot_token=settings.bot_token,
+        admin_tg_ids=settings.admin_tg_ids,
+        max_age_seconds=settings.telegram_auth_max_age_seconds,
+    )
+    try:
+        result: AuthResult = await service.authenticate(payload.initData)
+    except AuthError as exc:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(exc)) from exc
+    token, claims = issue_session_token(
+        result.user.id,
+        result.user.tg_id,
+        result.role,
+        result.is_active,
+        result.auth_date,
+    )
+    return TelegramAuthResponse(
+        tg_id=result.user.tg_id,
+        role=result.role,
+        session_token=token,
+        session_expires_at=claims.exp,
+    )
@@ -4,11 +4,18 @@ from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.db import get_session
+from app.db import get_read_session
+from app.dependencies.concurrency import concurrency_slot
+from app.dependencies.rate_limit import limit_bot_requests
+from app.services.concurrency import GROUP_INTERNAL
+from app.services.read_routing import SERVERS_KEY, pin_primary, recent_writes
 from app.services.subscription_service import SubscriptionService
 
 router = APIRouter(prefix="/api/bot", tags=["bot"])
 
+# бот ставит заголовок сразу после оплаты: реплика может еще не догнать primary
+READ_PRIMARY_HEADER = "X-Read-Primary"
+
 
 class BotSubscriptionRequest(BaseModel):
     tg_id: int
@@ -23,16 +30,26 @@ class BotSubscriptionResponse(BaseModel):
     servers_count: int = 0
 
 
-@router.post("/subscription", response_model=BotSubscriptionResponse, summary="Состояние подписки для бота")
+@router.post(
+    "/subscription",
+    response_model=BotSubscriptionResponse,
+    summary="Состояние подписки для бота",
+    dependencies=[Depends(limit_bot_requests), Depends(concurrency_slot(GROUP_INTERNAL))],
+)
 async def bot_subscription(
     payload: BotSubscriptionRequest,
     bot_token: str = Header(..., alias="X-Bot-Token"),
-    session: AsyncSession = Depends(get_session),
+    read_primary: bool = Header(False, alias=READ_PRIMARY_HEADER),
+    session: AsyncSession = Depends(get_read_session),
 ) -> BotSubscriptionResponse:
     """Бот запрашивает фактическое состояние подписки по tg_id."""
     if bot_token != settings.bot_token:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Неверный X-Bot-Token")
 
+    if read_primary:
+        pin_primary(session)
+    else:
+        recent_writes.route(session, SERVERS_KEY)
     service = SubscriptionService(session)
     summary = await service.get_subscription_summary_by_tg_id(payload.tg_id)
     return BotSubscriptionResponse(**summary)
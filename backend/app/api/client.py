@@ -1,13 +1,17 @@
 """Маршруты для клиентского мини-приложения."""
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.dependencies.auth import AuthContext, get_auth_context
-from app.db import get_session
+from app.api.etag import REVALIDATE_CACHE_CONTROL, etag_matches, make_etag, not_modified
+from app.dependencies.auth import SESSION_TOKEN_HEADER, AuthContext, get_auth_context
+from app.dependencies.concurrency import concurrency_slot
+from app.db import get_read_session
+from app.services.concurrency import GROUP_CLIENT
+from app.services.read_routing import SERVERS_KEY, recent_writes
 from app.services.subscription_service import SubscriptionService
 
-router = APIRouter(prefix="/api/me", tags=["client"])
+router = APIRouter(prefix="/api/me", tags=["client"], dependencies=[Depends(concurrency_slot(GROUP_CLIENT))])
 
 
 class SubscriptionInfo(BaseModel):
@@ -19,12 +23,61 @@ class SubscriptionInfo(BaseModel):
     servers_count: int = 0
 
 
+class ProfileInfo(BaseModel):
+    user_id: int
+    tg_id: int
+    is_active: bool
+
+
+class BootstrapInfo(BaseModel):
+    role: str
+    profile: ProfileInfo
+    subscription: SubscriptionInfo
+
+
+def _revalidated(request: Request, response: Response, body: dict) -> Response | None:
+    etag = make_etag(body)
+    if etag_matches(request, etag):
+        # 304 собирается заново, поэтому переносим обновленный сессионный токен вручную
+        token = response.headers.get(SESSION_TOKEN_HEADER)
+        return not_modified(etag, {SESSION_TOKEN_HEADER: token} if token else None)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+    return None
+
+
 @router.get("/subscription", response_model=SubscriptionInfo, summary="Статус подписки текущего пользователя")
 async def my_subscription(
+    request: Request,
+    response: Response,
     auth: AuthContext = Depends(get_auth_context),
-    session: AsyncSession = Depends(get_session),
-) -> SubscriptionInfo:
+    session: AsyncSession = Depends(get_read_session),
+) -> SubscriptionInfo | Response:
     """Вернуть состояние подписки для текущего пользователя."""
+    recent_writes.route(session, f"user:{auth.user_id}", SERVERS_KEY)
+    service = SubscriptionService(session)
+    summary = await service.get_subscription_summary(auth.user_id if auth.is_active else None)
+    return _revalidated(request, response, summary) or SubscriptionInfo(**summary)
+
+
+@router.get("/bootstrap", response_model=BootstrapInfo, summary="Роль, профиль и подписка для первого экрана")
+async def bootstrap(
+    request: Request,
+    response: Response,
+    auth: AuthContext = Depends(get_auth_context),
+    session: AsyncSession = Depends(get_read_session),
+) -> BootstrapInfo | Response:
+    """Все данные стартового экрана Mini App за один запрос.
+
+    Аутентификация проходит один раз (сессионный токен или initData), пользователь
+    берется из контекста без повторной загрузки, свежий токен приходит в `X-Session-Token`.
+    """
+    recent_writes.route(session, f"user:{auth.user_id}", SERVERS_KEY)
     service = SubscriptionService(session)
-    summary = await service.get_subscription_summary_by_tg_id(auth.tg_id if auth.is_active else -1)
-    return SubscriptionInfo(**summary)
+    summary = await service.get_subscription_summary(auth.user_id if auth.is_active else None)
+    body = {
+        "role": auth.role,
+        "profile": {"user_id": auth.user_id, "tg_id": auth.tg_id, "is_active": auth.is_active},
+        "subscription": summary,
+    }
+    return _revalidated(request, response, body) or BootstrapInfo(**body)
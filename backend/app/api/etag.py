@@ -0,0 +1,34 @@
+"""Условные GET: сильные ETag и ответы 304 Not Modified."""
+import hashlib
+import json
+from typing import Any
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+# клиент может хранить ответ, но обязан перепроверить его через If-None-Match
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts: Any) -> str:
+    """Сильный ETag из значений, однозначно определяющих ответ."""
+    raw = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return '"' + hashlib.sha256(raw.encode()).hexdigest()[:32] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Слабое сравнение If-None-Match, как требует RFC 9110."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = {candidate.strip().removeprefix("W/") for candidate in header.split(",")}
+    return etag in candidates
+
+
+def not_modified(etag: str, headers: dict[str, str] | None = None) -> Response:
+    return Response(
+        status_code=304,
+        headers={**(headers or {}), "ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL},
+    )
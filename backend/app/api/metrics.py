@@ -0,0 +1,25 @@
+"""Счетчики нагрузки воркера для подбора лимитов и пулов."""
+import hmac
+
+from fastapi import APIRouter, Header, HTTPException, status
+
+from app.config import settings
+from app.db import engine, read_engine
+from app.services.concurrency import concurrency_limiters
+from app.services.db_pool import pool_gauges
+
+router = APIRouter(prefix="/api/metrics", tags=["metrics"])
+
+
+@router.get("", summary="Счетчики нагрузки текущего воркера")
+async def worker_metrics(metrics_token: str | None = Header(None, alias="X-Metrics-Token")) -> dict:
+    """Слоты групп маршрутов и пул соединений БД: занято, очередь, отказы и время ожидания."""
+    if not settings.metrics_token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Метрики выключены")
+    if not metrics_token or not hmac.compare_digest(metrics_token, settings.metrics_token):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Неверный X-Metrics-Token")
+    return {
+        "concurrency": {name: limiter.snapshot() for name, limiter in concurrency_limiters.items()},
+        "db_pool": pool_gauges(engine),
+        "db_read_pool": pool_gauges(read_engine) if read_engine is not engine else None,
+    }
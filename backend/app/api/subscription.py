@@ -1,28 +1,92 @@
 """HTTP endpoint для выдачи подписки."""
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import PlainTextResponse
+import asyncio
+import logging
+from urllib.parse import quote
+
+import asyncpg
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import PlainTextResponse, Response
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db import get_session
+from app.api.etag import REVALIDATE_CACHE_CONTROL, etag_matches, make_etag, not_modified
+from app.config import settings
+from app.db import get_read_session
+from app.dependencies.concurrency import concurrency_slot
+from app.dependencies.rate_limit import limit_subscription_requests
+from app.services.concurrency import GROUP_SUBSCRIPTION
+from app.services.last_known_good import StaleResponse, last_known_good
+from app.services.read_routing import SERVERS_KEY, recent_writes
+from app.services.subscription_renderer import NoCompatibleServers, UnknownSubscriptionFormat, detect_format
 from app.services.subscription_service import (
     NoActiveServers,
+    SubscriptionPayload,
     SubscriptionService,
     SubscriptionUnavailable,
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+# ошибки, при которых вместо 500 отдаем последний удачный ответ (stale-if-error)
+_DB_ERRORS = (SQLAlchemyError, asyncpg.PostgresError, asyncpg.InterfaceError, OSError, asyncio.TimeoutError)
+STALE_WARNING = '111 - "Revalidation Failed"'
+
+
+def _client_hint_headers(payload: SubscriptionPayload) -> dict[str, str]:
+    """Заголовки, которые понимают v2rayN/Hiddify/Streisand и др.: как часто обновлять и когда истекает."""
+    expire = int(payload.subscription.expires_at.timestamp())
+    return {
+        "profile-update-interval": str(settings.sub_update_interval_hours),
+        # трафик не учитываем (см. README), поэтому отдаем только срок
+        "subscription-userinfo": f"expire={expire}",
+        "content-disposition": f"attachment; filename*=UTF-8''{quote(settings.sub_profile_title)}",
+    }
+
+
+async def _load_payload(service: SubscriptionService, token: str, fmt: str) -> SubscriptionPayload:
+    """Бюджет задержки действует, только если есть что отдать вместо ответа БД."""
+    budget = settings.sub_db_latency_budget_seconds
+    if budget > 0 and last_known_good.peek(token, fmt):
+        return await asyncio.wait_for(service.get_subscription_payload(token, fmt), timeout=budget)
+    return await service.get_subscription_payload(token, fmt)
+
 
-@router.get("/sub/{token}", response_class=PlainTextResponse, summary="Динамическая подписка VLESS")
+def _stale_response(request: Request, stale: StaleResponse) -> Response:
+    headers = {**stale.headers, "Warning": STALE_WARNING}
+    if etag_matches(request, stale.etag):
+        return not_modified(stale.etag, headers)
+    return Response(
+        stale.body,
+        media_type=stale.media_type,
+        headers={**headers, "ETag": stale.etag, "Cache-Control": REVALIDATE_CACHE_CONTROL},
+    )
+
+
+@router.get(
+    "/sub/{token}",
+    response_class=PlainTextResponse,
+    summary="Динамическая подписка VLESS",
+    dependencies=[Depends(limit_subscription_requests), Depends(concurrency_slot(GROUP_SUBSCRIPTION))],
+)
 async def get_subscription(
     token: str,
-    session: AsyncSession = Depends(get_session),
-) -> PlainTextResponse:
-    """Дать клиенту актуальный список VLESS ссылок."""
+    request: Request,
+    format: str | None = None,
+    session: AsyncSession = Depends(get_read_session),
+) -> Response:
+    """Дать клиенту актуальный список VLESS ссылок (или Clash/sing-box/base64 по `?format=` и User-Agent)."""
+    try:
+        fmt = detect_format(format, request.headers.get("user-agent"))
+    except UnknownSubscriptionFormat as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    recent_writes.route(session, f"token:{token}", SERVERS_KEY)
     service = SubscriptionService(session)
     try:
-        payload = await service.build_subscription_payload(token)
+        payload = await _load_payload(service, token, fmt)
     except SubscriptionUnavailable:
+        last_known_good.forget(token)
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Подписка недоступна или истекла",
@@ -32,9 +96,49 @@ async def get_subscription(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Нет активных серверов для выдачи конфигурации",
         )
+    except NoCompatibleServers as exc:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(exc)) from exc
+    except _DB_ERRORS as exc:
+        stale = await last_known_good.lookup(token, fmt)
+        if stale is None:
+            logger.error("БД недоступна, подписку отдать нечем", exc_info=exc, extra={"token_prefix": token[:6]})
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Сервис временно недоступен",
+                headers={"Retry-After": str(settings.sub_retry_after_seconds)},
+            ) from exc
+        logger.warning(
+            "БД недоступна, отдаем последнюю удачную подписку",
+            extra={"token_prefix": token[:6], "error": type(exc).__name__, "format": fmt},
+        )
+        return _stale_response(request, stale)
     except ValueError as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(exc),
         ) from exc
-    return PlainTextResponse(payload, media_type="text/plain")
+    etag = make_etag(fmt, *payload.version_key)
+    headers = {**_client_hint_headers(payload), "Vary": "User-Agent"}
+    if etag_matches(request, etag) and not last_known_good.wants(token, fmt, etag):
+        # тело рендерим только чтобы один раз запомнить его для stale-if-error
+        return not_modified(etag, headers)
+    try:
+        rendered = payload.render(fmt)
+    except NoCompatibleServers as exc:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(exc)) from exc
+    await last_known_good.remember(
+        token,
+        fmt,
+        etag=etag,
+        body=rendered.body,
+        media_type=rendered.media_type,
+        headers=headers,
+        expires_at=int(payload.subscription.expires_at.timestamp()),
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag, headers)
+    return Response(
+        rendered.body,
+        media_type=rendered.media_type,
+        headers={**headers, "ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL},
+    )
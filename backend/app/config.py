@@ -5,18 +5,74 @@ from pydantic import field_validator
 
 class Settings(BaseSettings):
     database_url: str
+    database_read_url: str | None = None
     base_sub_url: str
     bot_token: str
     admin_tg_ids: list[int] = []
+    telegram_auth_max_age_seconds: int = 86400
+    auth_cache_ttl_seconds: int = 300
+    auth_cache_max_size: int = 10000
+    session_secret: str | None = None
+    session_token_ttl_seconds: int = 900
+    session_max_age_seconds: int = 86400
     log_level: str = "INFO"
     xui_base_url: str = "http://localhost:54321"
     xui_username: str = "admin"
     xui_password: str = "admin"
     xui_request_timeout: int = 15
+    xui_pool_size: int = 20
+    xui_inbound_cache_ttl_seconds: float = 30.0
     xui_reality_public_key: str | None = None
     xui_reality_fingerprint: str = "chrome"
     xui_reality_short_id: str | None = None
     xui_reality_spider_x: str = "/"
+    sub_update_interval_hours: int = 12
+    sub_profile_title: str = "VPN"
+    server_catalog_ttl_seconds: int = 30
+    subscription_token_keys: str = ""
+    subscription_token_active_key_id: str | None = None
+    subscription_token_require_signed: bool = False
+    token_cache_ttl_seconds: int = 60
+    token_cache_negative_ttl_seconds: int = 10
+    token_cache_max_size: int = 50000
+    change_notifications_enabled: bool = True
+    subscription_redis_url: str | None = None
+    sub_store_max_ttl_seconds: int = 86400
+    sub_stale_if_error_seconds: int = 3600
+    sub_lkg_max_size: int = 10000
+    sub_lkg_max_bytes: int = 64 * 1024 * 1024
+    sub_lkg_path: str | None = None
+    sub_db_latency_budget_seconds: float = 2.0
+    sub_retry_after_seconds: int = 30
+    rate_limit_enabled: bool = True
+    rate_limit_redis_url: str | None = None
+    rate_limit_trusted_proxy_hops: int = 1
+    rate_limit_max_keys: int = 100000
+    rate_limit_sub_token: str = "30/600"
+    rate_limit_sub_ip: str = "120/60"
+    rate_limit_bot_ip: str = "1200/60"
+    concurrency_sub_limit: int | None = None
+    concurrency_client_limit: int | None = None
+    concurrency_internal_limit: int | None = None
+    concurrency_db_headroom: int = 2
+    concurrency_queue_timeout_seconds: float = 0.5
+    concurrency_retry_after_seconds: int = 2
+    metrics_token: str | None = None
+    read_your_writes_seconds: float = 10.0
+    expiry_window_seconds: int = 3600
+    expiry_batch_size: int = 1000
+    expiry_resync_seconds: int = 300
+    background_jobs_enabled: bool = True
+    jobs_lock_retry_seconds: float = 15.0
+    jobs_heartbeat_seconds: float = 10.0
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 10.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = False
+    db_statement_cache_size: int = 100
+    db_pgbouncer: bool = False
+    db_pool_warmup: int | None = None
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
 
@@ -1,3 +1,25 @@
-from app.db.session import Base, AsyncSessionLocal, engine, get_session, init_db
+from app.db.session import (
+    AsyncSessionLocal,
+    Base,
+    ReadSessionLocal,
+    create_missing_indexes,
+    engine,
+    get_read_session,
+    get_session,
+    init_db,
+    pool_options,
+    read_engine,
+)
 
-__all__ = ["Base", "AsyncSessionLocal", "engine", "get_session", "init_db"]
+__all__ = [
+    "Base",
+    "AsyncSessionLocal",
+    "ReadSessionLocal",
+    "engine",
+    "read_engine",
+    "get_session",
+    "get_read_session",
+    "init_db",
+    "create_missing_indexes",
+    "pool_options",
+]
@@ -1,10 +1,16 @@
 """Инициализация подключения к базе данных и фабрика сессий."""
+from collections.abc import Callable
 from typing import AsyncIterator
 
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import DeclarativeBase, Session
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.sql.dml import UpdateBase
 
 from app.config import settings
+from app.services.db_pool import PoolOptions, create_pooled_engine
+from app.services.read_routing import USE_PRIMARY
 
 
 class Base(DeclarativeBase):
@@ -12,9 +18,42 @@ class Base(DeclarativeBase):
 
 
 echo_sql = settings.log_level.upper() == "DEBUG"
-engine = create_async_engine(settings.database_url, echo=echo_sql, future=True)
+pool_options = PoolOptions(
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+    statement_cache_size=settings.db_statement_cache_size,
+    pgbouncer=settings.db_pgbouncer,
+    warmup=settings.db_pool_warmup,
+)
+engine = create_pooled_engine(settings.database_url, pool_options, echo=echo_sql, future=True)
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+# без DATABASE_READ_URL читающие сессии — обычные сессии primary
+read_engine = (
+    create_pooled_engine(settings.database_read_url, pool_options, echo=echo_sql, future=True)
+    if settings.database_read_url
+    else engine
+)
+
+
+class RoutingSession(Session):
+    """SELECT — на реплику, запись, flush и закрепленные сессии — на primary."""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.info.get(USE_PRIMARY) or self._flushing or isinstance(clause, UpdateBase):
+            return engine.sync_engine
+        return read_engine.sync_engine
+
+
+ReadSessionLocal = (
+    async_sessionmaker(expire_on_commit=False, class_=AsyncSession, sync_session_class=RoutingSession)
+    if read_engine is not engine
+    else AsyncSessionLocal
+)
+
 
 async def get_session() -> AsyncIterator[AsyncSession]:
     """Зависимость FastAPI для выдачи сессии."""
@@ -22,9 +61,53 @@ async def get_session() -> AsyncIterator[AsyncSession]:
         yield session
 
 
+async def get_read_session() -> AsyncIterator[AsyncSession]:
+    """Сессия для читающих маршрутов: с реплики, если она настроена."""
+    async with ReadSessionLocal() as session:
+        yield session
+
+
 async def init_db() -> None:
-    """Создать таблицы, если их еще нет."""
+    """Создать таблицы, если их еще нет.
+
+    Индексы `create_all` создает только вместе с новой таблицей; индексы,
+    добавленные в модели позже, досоздает `python -m app.jobs indexes`.
+    """
     from app.models import Server, Subscription, User  # noqa: F401
 
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+
+
+_INVALID_INDEXES_SQL = text(
+    """
+    SELECT c.relname
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE NOT i.indisvalid AND c.relname = ANY(:names)
+    """
+)
+
+
+async def create_missing_indexes(on_index: Callable[[str], None] | None = None) -> None:
+    """Досоздать индексы моделей в существующей БД, не блокируя запись.
+
+    `CREATE INDEX CONCURRENTLY IF NOT EXISTS` по одному индексу вне
+    транзакции. Недостроенный (INVALID) индекс прерванного запуска
+    удаляется и строится заново. `on_index(имя)` — прогресс.
+    """
+    from app.models import Server, Subscription, User  # noqa: F401
+
+    indexes = [index for table in Base.metadata.sorted_tables for index in table.indexes]
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        preparer = conn.dialect.identifier_preparer
+        invalid = await conn.execute(_INVALID_INDEXES_SQL, {"names": [index.name for index in indexes]})
+        for name in invalid.scalars():
+            await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {preparer.quote(name)}"))
+        for index in indexes:
+            # флаг влияет только на DDL индекса, create_all в этом процессе не вызывается
+            index.dialect_kwargs["postgresql_concurrently"] = True
+            await conn.execute(CreateIndex(index, if_not_exists=True))
+            if on_index:
+                on_index(index.name)
@@ -1,12 +1,24 @@
 """Зависимости FastAPI для аутентификации через Telegram Mini App."""
+import hashlib
+import time
 from dataclasses import dataclass
 
-from fastapi import Depends, Header, HTTPException, status
+from fastapi import Depends, Header, HTTPException, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
 from app.db import get_session
 from app.services.auth_service import AuthError, AuthResult, AuthService
+from app.services.session_tokens import (
+    InvalidSessionToken,
+    issue_session_token,
+    session_deadline,
+    verify_session_token,
+)
+from app.services.ttl_cache import TTLCache
+
+# Ответный заголовок, в котором клиент получает свежий сессионный токен
+SESSION_TOKEN_HEADER = "X-Session-Token"
 
 
 @dataclass
@@ -15,26 +27,107 @@ class AuthContext:
     tg_id: int
     role: str
     is_active: bool
+    # auth_date initData, от которой отсчитывается абсолютный срок сессии
+    auth_date: int
+
+
+# Проверенные initData: Mini App шлет одну и ту же строку на каждый запрос.
+_auth_cache: TTLCache[str, AuthContext] = TTLCache(
+    max_size=settings.auth_cache_max_size,
+    ttl_seconds=settings.auth_cache_ttl_seconds,
+)
+
+
+def _auth_cache_ttl(auth_date: int) -> float:
+    """Кэшируем не дольше, чем initData остается свежей."""
+    ttl = float(settings.auth_cache_ttl_seconds)
+    if settings.telegram_auth_max_age_seconds:
+        ttl = min(ttl, auth_date + settings.telegram_auth_max_age_seconds - time.time())
+    return ttl
+
+
+def _bearer_token(authorization: str | None) -> str | None:
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return token.strip()
+
+
+def _refresh_session_token(response: Response, context: AuthContext, seconds_left: float = 0) -> None:
+    """Выдать новый токен, если текущего нет или прошла половина его жизни.
+
+    Продлить дальше абсолютного срока сессии нельзя: после него клиент
+    получит `401` и заново авторизуется по свежей initData.
+    """
+    if seconds_left > settings.session_token_ttl_seconds / 2:
+        return
+    if session_deadline(context.auth_date) <= time.time() + seconds_left:
+        return
+    token, _ = issue_session_token(
+        context.user_id,
+        context.tg_id,
+        context.role,
+        context.is_active,
+        context.auth_date,
+    )
+    response.headers[SESSION_TOKEN_HEADER] = token
 
 
 async def get_auth_context(
+    response: Response,
+    authorization: str | None = Header(None),
     init_data: str | None = Header(None, alias="X-Telegram-Init-Data"),
     session: AsyncSession = Depends(get_session),
 ) -> AuthContext:
-    """Проверить подпись Telegram и вернуть контекст пользователя."""
+    """Проверить сессионный токен или подпись Telegram и вернуть контекст пользователя."""
+    bearer = _bearer_token(authorization)
+    if bearer:
+        try:
+            claims = verify_session_token(bearer)
+        except InvalidSessionToken as exc:
+            if not init_data:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(exc)) from exc
+        else:
+            context = AuthContext(
+                user_id=claims.user_id,
+                tg_id=claims.tg_id,
+                role=claims.role,
+                is_active=claims.is_active,
+                auth_date=claims.auth_date,
+            )
+            _refresh_session_token(response, context, claims.seconds_left())
+            return context
+
     if not init_data:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="initData отсутствует")
-    service = AuthService(session=session, bot_token=settings.bot_token, admin_tg_ids=settings.admin_tg_ids)
+    cache_key = hashlib.sha256(init_data.encode()).hexdigest()
+    cached = _auth_cache.get(cache_key)
+    if cached:
+        _refresh_session_token(response, cached)
+        return cached
+
+    service = AuthService(
+        session=session,
+        bot_token=settings.bot_token,
+        admin_tg_ids=settings.admin_tg_ids,
+        max_age_seconds=settings.telegram_auth_max_age_seconds,
+    )
     try:
         result: AuthResult = await service.authenticate(init_data)
     except AuthError as exc:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(exc)) from exc
-    return AuthContext(
+    context = AuthContext(
         user_id=result.user.id,
         tg_id=result.user.tg_id,
         role=result.role,
         is_active=result.is_active,
+        auth_date=result.auth_date,
     )
+    _auth_cache.set(cache_key, context, ttl_seconds=_auth_cache_ttl(result.auth_date))
+    _refresh_session_token(response, context)
+    return context
 
 
 async def require_admin(context: AuthContext = Depends(get_auth_context)) -> AuthContext:
@@ -0,0 +1,31 @@
+"""Зависимость FastAPI, которая держит слот группы маршрутов на время запроса.
+
+Как и лимит частоты, подключается через `dependencies=[...]` маршрута или
+роутера, чтобы слот занимался до получения сессии БД.
+"""
+from typing import AsyncIterator, Callable
+
+from fastapi import HTTPException, status
+
+from app.config import settings
+from app.services.concurrency import Overloaded, concurrency_limiters
+
+
+def concurrency_slot(group: str) -> Callable[[], AsyncIterator[None]]:
+    limiter = concurrency_limiters[group]
+
+    async def hold_slot() -> AsyncIterator[None]:
+        try:
+            await limiter.acquire()
+        except Overloaded as exc:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Сервер перегружен, повторите позже",
+                headers={"Retry-After": str(settings.concurrency_retry_after_seconds)},
+            ) from exc
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    return hold_slot
@@ -0,0 +1,48 @@
+"""Зависимости FastAPI для лимита частоты запросов.
+
+Подключаются через `dependencies=[...]` маршрута: FastAPI разрешает их раньше
+параметров эндпоинта, поэтому отклоненный запрос не берет сессию БД.
+"""
+import math
+
+from fastapi import HTTPException, Request, status
+
+from app.config import settings
+from app.services.rate_limiter import RateLimit, parse_rate_limit, rate_limiter
+
+_SUB_TOKEN_LIMIT = parse_rate_limit(settings.rate_limit_sub_token)
+_SUB_IP_LIMIT = parse_rate_limit(settings.rate_limit_sub_ip)
+_BOT_IP_LIMIT = parse_rate_limit(settings.rate_limit_bot_ip)
+
+
+def client_ip(request: Request) -> str:
+    """IP клиента: n-й справа адрес из `X-Forwarded-For`, который дописал наш nginx."""
+    hops = settings.rate_limit_trusted_proxy_hops
+    forwarded = request.headers.get("x-forwarded-for")
+    if hops > 0 and forwarded:
+        addresses = [part.strip() for part in forwarded.split(",") if part.strip()]
+        if addresses:
+            return addresses[-min(hops, len(addresses))]
+    return request.client.host if request.client else "unknown"
+
+
+async def _enforce(key: str, limit: RateLimit | None) -> None:
+    if limit is None or not settings.rate_limit_enabled:
+        return
+    retry_after = await rate_limiter.hit(key, limit)
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Слишком много запросов",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+async def limit_subscription_requests(request: Request, token: str) -> None:
+    """`/sub/{token}`: отдельные ведра на токен и на IP (сканеры перебирают токены)."""
+    await _enforce(f"sub:ip:{client_ip(request)}", _SUB_IP_LIMIT)
+    await _enforce(f"sub:token:{token}", _SUB_TOKEN_LIMIT)
+
+
+async def limit_bot_requests(request: Request) -> None:
+    await _enforce(f"bot:ip:{client_ip(request)}", _BOT_IP_LIMIT)
@@ -0,0 +1,130 @@
+"""Фоновые задачи отдельным процессом, без веб-воркеров.
+
+    python -m app.jobs expire                  # разовый проход по всем истекшим подпискам
+    python -m app.jobs expire --daemon         # планировщик истечения, пока процесс не остановят
+    python -m app.jobs expire --pool-size 4 --batch-size 500
+    python -m app.jobs indexes                 # досоздать новые индексы (после обновления)
+
+Задачи используют те же сервисы и настройки, что и backend, но свой пул
+соединений (`--pool-size`, по умолчанию 2, без overflow), поэтому медленный
+проход по 3X-UI не отнимает соединения и event loop у `/sub`. В режиме
+`--daemon` задача берет ту же advisory-блокировку, что и веб-воркеры:
+чтобы задачу выполнял только этот процесс, выставьте веб-воркерам
+`BACKGROUND_JOBS_ENABLED=false`.
+
+`indexes` строит индексы, которых еще нет в существующей БД, через
+`CREATE INDEX CONCURRENTLY`: запись в таблицы при этом не блокируется.
+Запускайте один раз после обновления, не параллельно.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import time
+from collections.abc import Awaitable, Callable
+
+
+def _print(job: str, message: str, started: float) -> None:
+    print(f"[{job}] {message} ({time.monotonic() - started:.1f} с)", flush=True)
+
+
+async def _expire_once() -> None:
+    from app.services.cleanup_service import deactivate_expired_subscriptions
+
+    started = time.monotonic()
+    _print("expire", "поиск истекших подписок", started)
+    total = await deactivate_expired_subscriptions(
+        on_batch=lambda count, done: _print("expire", f"порция {count}, всего {done}", started),
+    )
+    _print("expire", f"готово, деактивировано {total}", started)
+
+
+async def _expire_daemon() -> None:
+    from app.config import settings
+    from app.services.change_notify import SUBSCRIPTION_CHANGES_CHANNEL, ChangeListener
+    from app.services.expiry_scheduler import EXPIRY_SCHEDULER_JOB, expiry_scheduler
+    from app.services.job_runner import job_runner
+
+    started = time.monotonic()
+    listener = ChangeListener(settings.database_url)
+    listener.subscribe(SUBSCRIPTION_CHANGES_CHANNEL, expiry_scheduler.handle_notification)
+    job_runner.register(EXPIRY_SCHEDULER_JOB, expiry_scheduler.run)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    if settings.change_notifications_enabled:
+        await listener.start()
+    await job_runner.start()
+    _print("expire", "планировщик запущен, ждем блокировку лидера", started)
+    try:
+        await stop.wait()
+    finally:
+        await job_runner.stop()
+        await listener.stop()
+    _print("expire", "остановлен", started)
+
+
+async def _create_indexes() -> None:
+    from app.db import create_missing_indexes
+
+    started = time.monotonic()
+    _print("indexes", "проверка индексов", started)
+    await create_missing_indexes(on_index=lambda name: _print("indexes", f"{name} готов", started))
+    _print("indexes", "готово", started)
+
+
+# имя -> (разовый запуск, режим демона или None)
+JOBS: dict[str, tuple[Callable[[], Awaitable[None]], Callable[[], Awaitable[None]] | None]] = {
+    "expire": (_expire_once, _expire_daemon),
+    "indexes": (_create_indexes, None),
+}
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m app.jobs", description="Фоновые задачи backend")
+    parser.add_argument("job", choices=sorted(JOBS), help="какую задачу запустить")
+    parser.add_argument("--daemon", action="store_true", help="работать постоянно, а не один проход")
+    parser.add_argument("--pool-size", type=int, default=2, help="соединений с БД у процесса")
+    parser.add_argument("--batch-size", type=int, default=None, help="строк за одну транзакцию")
+    args = parser.parse_args(argv)
+    if args.daemon and JOBS[args.job][1] is None:
+        parser.error(f"задача {args.job} не работает в режиме --daemon")
+    return args
+
+
+def _configure_env(args: argparse.Namespace) -> None:
+    # Settings читает окружение при импорте app.config, поэтому задаем его до импорта сервисов
+    os.environ["DB_POOL_SIZE"] = str(args.pool_size)
+    os.environ["DB_MAX_OVERFLOW"] = "0"
+    if args.batch_size:
+        os.environ["EXPIRY_BATCH_SIZE"] = str(args.batch_size)
+
+
+async def _run(job: str, daemon: bool) -> None:
+    from app.db import engine
+    from app.services.xui_client import xui_client
+
+    once, forever = JOBS[job]
+    try:
+        await (forever() if daemon else once())
+    finally:
+        await xui_client.close()
+        await engine.dispose()
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = _parse_args(argv)
+    _configure_env(args)
+
+    from app.config import settings
+
+    logging.basicConfig(level=getattr(logging, settings.log_level.upper(), logging.INFO))
+    asyncio.run(_run(args.job, args.daemon))
+
+
+if __name__ == "__main__":
+    main()
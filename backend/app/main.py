@@ -1,5 +1,4 @@
 """Точка входа FastAPI-приложения."""
-import asyncio
 import logging
 from pathlib import Path
 from urllib.parse import urlsplit
@@ -13,11 +12,23 @@ from starlette.staticfiles import StaticFiles
 from app.api.admin_servers import router as admin_servers_router
 from app.api.auth import router as auth_router
 from app.api.client import router as client_router
+from app.api.metrics import router as metrics_router
 from app.api.bot import router as bot_router
 from app.api.subscription import router as subscription_router
 from app.config import settings
-from app.db import init_db
-from app.services.cleanup_service import expired_subscriptions_loop
+from app.db import engine, init_db, pool_options, read_engine
+from app.services.change_notify import SERVER_CHANGES_CHANNEL, SUBSCRIPTION_CHANGES_CHANNEL, ChangeListener
+from app.services.concurrency import check_pool_capacity
+from app.services.db_pool import warm_up
+from app.services.expiry_scheduler import EXPIRY_SCHEDULER_JOB, expiry_scheduler
+from app.services.job_runner import job_runner
+from app.services.last_known_good import last_known_good
+from app.services.rate_limiter import rate_limiter
+from app.services.read_routing import recent_writes
+from app.services.server_catalog import server_catalog
+from app.services.subscription_store import subscription_store
+from app.services.token_cache import token_cache
+from app.services.xui_client import xui_client
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +54,17 @@ def configure_logging() -> None:
 def create_app() -> FastAPI:
     app = FastAPI(title="VPN Subscription Backend", docs_url="/docs", openapi_url="/openapi.json")
     static_dir = Path(__file__).resolve().parent.parent / "webapp"
+    change_listener = ChangeListener(settings.database_url)
+    # подписчики вызываются по порядку: ключ закрепляется за primary до сброса кэшей
+    change_listener.subscribe(SUBSCRIPTION_CHANGES_CHANNEL, recent_writes.handle_notification)
+    change_listener.subscribe(SUBSCRIPTION_CHANGES_CHANNEL, token_cache.handle_notification)
+    change_listener.subscribe(SUBSCRIPTION_CHANGES_CHANNEL, subscription_store.handle_notification)
+    change_listener.subscribe(SUBSCRIPTION_CHANGES_CHANNEL, last_known_good.handle_notification)
+    change_listener.subscribe(SUBSCRIPTION_CHANGES_CHANNEL, expiry_scheduler.handle_notification)
+    change_listener.subscribe(SERVER_CHANGES_CHANNEL, recent_writes.handle_server_notification)
+    change_listener.subscribe(SERVER_CHANGES_CHANNEL, server_catalog.handle_notification)
+    # фоновые задачи: в каждой выполняется ровно один процесс из всех воркеров и реплик
+    job_runner.register(EXPIRY_SCHEDULER_JOB, expiry_scheduler.run)
 
     @app.exception_handler(RequestValidationError)
     async def validation_exception_handler(request: Request, exc: RequestValidationError) -> JSONResponse:
@@ -59,16 +81,34 @@ def create_app() -> FastAPI:
         """Создаем таблицы и включаем логирование при запуске."""
         configure_logging()
         logger.info("Старт backend", extra={"database_url": _mask_dsn(settings.database_url)})
+        check_pool_capacity()
         await init_db()
         logger.info("Инициализация БД завершена")
-        # Фоновая задача: ежедневная деактивация истекших подписок
-        asyncio.create_task(expired_subscriptions_loop())
+        await warm_up(engine, pool_options)
+        if read_engine is not engine:
+            await warm_up(read_engine, pool_options)
+        await last_known_good.purge_file()
+        if settings.background_jobs_enabled:
+            # иначе задачи выполняет отдельный процесс `python -m app.jobs ... --daemon`
+            await job_runner.start()
+        if settings.change_notifications_enabled:
+            await change_listener.start()
+
+    @app.on_event("shutdown")
+    async def on_shutdown() -> None:
+        """Останавливаем фоновые задачи, закрываем соединение LISTEN, клиенты Redis и 3X-UI."""
+        await job_runner.stop()
+        await change_listener.stop()
+        await subscription_store.close()
+        await rate_limiter.close()
+        await xui_client.close()
 
     app.include_router(subscription_router)
     app.include_router(auth_router)
     app.include_router(bot_router)
     app.include_router(client_router)
     app.include_router(admin_servers_router)
+    app.include_router(metrics_router)
     if static_dir.exists():
         # Раздаем mini-app статику (index.html, admin.html и ассеты)
         app.mount("/", StaticFiles(directory=static_dir, html=True), name="webapp")
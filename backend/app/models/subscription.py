@@ -1,7 +1,7 @@
 """Модель подписки на VPN."""
 from datetime import datetime, timezone
 
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, Integer, String
 from sqlalchemy.orm import relationship
 
 from app.db import Base
@@ -25,3 +25,20 @@ class Subscription(Base):
         if now.tzinfo is None:
             now = now.replace(tzinfo=timezone.utc)
         return expires_at <= now
+
+
+# Последняя подписка пользователя — один index-only проход: ORDER BY expires_at DESC LIMIT 1
+Index(
+    "ix_subscriptions_user_id_expires_at",
+    Subscription.user_id,
+    Subscription.expires_at.desc(),
+    postgresql_include=["id", "token", "is_active"],
+)
+
+# Ближайшие истечения для планировщика: только активные подписки, по порядку срока
+Index(
+    "ix_subscriptions_active_expires_at",
+    Subscription.expires_at,
+    Subscription.id,
+    postgresql_where=Subscription.is_active.is_(True),
+)
@@ -3,15 +3,17 @@ import hashlib
 import hmac
 import json
 import logging
+import time
 from dataclasses import dataclass
 from datetime import datetime, timezone
+from functools import lru_cache
 from typing import Any
 from urllib.parse import parse_qsl
 
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import User
+from app.services.user_upsert import get_or_create_user
 
 logger = logging.getLogger(__name__)
 
@@ -25,27 +27,42 @@ class AuthResult:
     user: User
     role: str
     is_active: bool
+    auth_date: int
+
+
+@lru_cache(maxsize=8)
+def _webapp_secret_key(bot_token: str) -> bytes:
+    """HMAC-ключ WebAppData зависит только от токена бота, считаем его один раз."""
+    return hmac.new("WebAppData".encode(), bot_token.encode(), hashlib.sha256).digest()
 
 
 class AuthService:
-    def __init__(self, session: AsyncSession, bot_token: str, admin_tg_ids: list[int] | None = None) -> None:
+    def __init__(
+        self,
+        session: AsyncSession,
+        bot_token: str,
+        admin_tg_ids: list[int] | None = None,
+        max_age_seconds: int | None = None,
+    ) -> None:
         self.session = session
         self.bot_token = bot_token
         self.admin_tg_ids = admin_tg_ids or []
+        self.max_age_seconds = max_age_seconds
 
     async def authenticate(self, init_data: str) -> AuthResult:
         """Проверить подпись, найти/создать пользователя и определить роль."""
         data = self._validate_signature(init_data)
+        auth_date = self._validate_auth_date(data)
         user_payload = self._extract_user(data)
         tg_id = self._extract_tg_id(user_payload)
 
         user = await self._get_or_create_user(tg_id)
-        role = await self._resolve_role(user)
+        role = self._resolve_role(user)
         logger.info(
             "Аутентификация Telegram WebApp",
             extra={"tg_id": tg_id, "role": role, "is_active": user.is_active},
         )
-        return AuthResult(user=user, role=role, is_active=user.is_active)
+        return AuthResult(user=user, role=role, is_active=user.is_active, auth_date=auth_date)
 
     def _validate_signature(self, init_data: str) -> dict[str, str]:
         """Подпись согласно https://core.telegram.org/bots/webapps#validating-data-received-via-the-mini-app."""
@@ -55,15 +72,23 @@ class AuthService:
             raise AuthError("hash отсутствует в initData")
 
         check_string = "\n".join(f"{k}={v}" for k, v in sorted(parsed.items()))
-        secret_key = hmac.new("WebAppData".encode(), self.bot_token.encode(), hashlib.sha256).digest()
+        secret_key = _webapp_secret_key(self.bot_token)
         computed_hash = hmac.new(secret_key, check_string.encode(), hashlib.sha256).hexdigest()
 
         if not hmac.compare_digest(computed_hash, received_hash):
             raise AuthError("Некорректная подпись Telegram")
-
-        # TODO: проверять auth_date на актуальность
         return parsed
 
+    def _validate_auth_date(self, parsed: dict[str, str]) -> int:
+        """initData старше `max_age_seconds` считается протухшей."""
+        try:
+            auth_date = int(parsed.get("auth_date", ""))
+        except ValueError as exc:
+            raise AuthError("Некорректный auth_date в initData") from exc
+        if self.max_age_seconds and time.time() - auth_date > self.max_age_seconds:
+            raise AuthError("initData устарела, переоткройте мини-приложение")
+        return auth_date
+
     @staticmethod
     def _extract_user(parsed: dict[str, str]) -> dict[str, Any]:
         user_raw = parsed.get("user")
@@ -82,25 +107,12 @@ class AuthService:
         return int(tg_id)
 
     async def _get_or_create_user(self, tg_id: int) -> User:
-        stmt = select(User).where(User.tg_id == tg_id)
-        result = await self.session.execute(stmt)
-        user = result.scalar_one_or_none()
-        if user:
-            logger.info("Пользователь найден", extra={"tg_id": tg_id, "user_id": user.id})
-            return user
-
-        user = User(tg_id=tg_id)
-        self.session.add(user)
-        await self.session.commit()
-        await self.session.refresh(user)
-        logger.info("Пользователь создан", extra={"tg_id": tg_id, "user_id": user.id})
+        user, written = await get_or_create_user(self.session, User, tg_id, self.admin_tg_ids)
+        if written:
+            await self.session.commit()
         return user
 
-    async def _resolve_role(self, user: User) -> str:
-        role = user.role or "user"
-        if user.tg_id in self.admin_tg_ids or role == "admin":
-            if role != "admin":
-                user.role = "admin"
-                await self.session.commit()
-            return "admin"
-        return "user"
+    @staticmethod
+    def _resolve_role(user: User) -> str:
+        """Повышение до admin уже сделано в `_get_or_create_user`, здесь только чтение."""
+        return "admin" if user.role == "admin" else "user"
@@ -0,0 +1,140 @@
+"""Уведомления об изменениях через Postgres LISTEN/NOTIFY.
+
+Писатели (backend, бот, фоновые задачи) вызывают `notify_*` внутри своей
+транзакции: Postgres доставит сообщение только после commit. Каждый воркер
+backend держит одно отдельное соединение `ChangeListener` и сбрасывает
+свои кэши по пришедшим сообщениям.
+
+Формат payload канала `subscription_changes`: элементы через запятую —
+`token:<token>`, `user:<user_id>` или `*` (сбросить всё). Канал
+`server_changes` несет только `*`: каталог серверов перечитывается целиком.
+
+Модуль не зависит от `app.config`, чтобы его можно было импортировать из бота.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Callable, Iterable
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_CHANGES_CHANNEL = "subscription_changes"
+SERVER_CHANGES_CHANNEL = "server_changes"
+
+# NOTIFY ограничивает payload 8000 байтами, оставляем запас
+_MAX_PAYLOAD_BYTES = 7500
+
+NotificationHandler = Callable[[str], None]
+
+
+def _chunk_payloads(items: Iterable[str]) -> list[str]:
+    payloads: list[str] = []
+    current: list[str] = []
+    size = 0
+    for item in items:
+        item_size = len(item.encode()) + 1
+        if current and size + item_size > _MAX_PAYLOAD_BYTES:
+            payloads.append(",".join(current))
+            current, size = [], 0
+        current.append(item)
+        size += item_size
+    if current:
+        payloads.append(",".join(current))
+    return payloads
+
+
+async def notify(session: AsyncSession, channel: str, items: Iterable[str]) -> None:
+    """Поставить уведомления в текущую транзакцию сессии."""
+    for payload in _chunk_payloads(items):
+        await session.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": channel, "payload": payload})
+
+
+async def notify_subscription_changes(
+    session: AsyncSession,
+    *,
+    tokens: Iterable[str] = (),
+    user_ids: Iterable[int] = (),
+) -> None:
+    items = [f"token:{token}" for token in tokens if token]
+    items.extend(f"user:{user_id}" for user_id in user_ids)
+    if items:
+        await notify(session, SUBSCRIPTION_CHANGES_CHANNEL, items)
+
+
+async def notify_server_changes(session: AsyncSession) -> None:
+    await notify(session, SERVER_CHANGES_CHANNEL, ["*"])
+
+
+def asyncpg_dsn(database_url: str) -> str:
+    url = make_url(database_url).set(drivername="postgresql")
+    return url.render_as_string(hide_password=False)
+
+
+class ChangeListener:
+    """Отдельное соединение LISTEN с автоматическим переподключением."""
+
+    def __init__(self, database_url: str, reconnect_delay: float = 5.0) -> None:
+        self._dsn = asyncpg_dsn(database_url)
+        self.reconnect_delay = reconnect_delay
+        self._handlers: dict[str, list[NotificationHandler]] = {}
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self, channel: str, handler: NotificationHandler) -> None:
+        self._handlers.setdefault(channel, []).append(handler)
+
+    async def start(self) -> None:
+        if self._task is None and self._handlers:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _dispatch(self, channel: str, payload: str) -> None:
+        for handler in self._handlers.get(channel, []):
+            try:
+                handler(payload)
+            except Exception as exc:
+                logger.exception("Ошибка обработчика уведомления", exc_info=exc, extra={"channel": channel})
+
+    def _on_notification(self, connection: object, pid: int, channel: str, payload: str) -> None:
+        self._dispatch(channel, payload)
+
+    async def _listen_once(self) -> None:
+        connection = await asyncpg.connect(self._dsn)
+        closed = asyncio.Event()
+        connection.add_termination_listener(lambda _conn: closed.set())
+        try:
+            for channel in self._handlers:
+                await connection.add_listener(channel, self._on_notification)
+            # пока соединения не было, уведомления могли потеряться
+            for channel in self._handlers:
+                self._dispatch(channel, "*")
+            logger.info("Подписка на уведомления Postgres активна", extra={"channels": list(self._handlers)})
+            await closed.wait()
+        finally:
+            if not connection.is_closed():
+                await connection.close()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._listen_once()
+                logger.warning("Соединение LISTEN закрыто, переподключаемся")
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Не удалось слушать уведомления Postgres", exc_info=exc)
+            await asyncio.sleep(self.reconnect_delay)
@@ -1,72 +1,125 @@
-"""Фоновая деактивация истекших подписок.
+"""Деактивация истекших подписок.
 
-Запускается раз в сутки и помечает истекшие подписки как неактивные.
-Если деплой не предполагает фоновые таски, можно вынести в cron/management команду (TODO).
+По расписанию подписки выключает `ExpiryScheduler` (см. `expiry_scheduler.py`)
+через `deactivate_subscriptions`; `deactivate_expired_subscriptions` — разовый
+полный проход по всем истекшим подпискам. Оба работают порциями по
+`EXPIRY_BATCH_SIZE`: каждая порция — отдельная транзакция, сразу после
+commit ее клиенты отключаются в 3X-UI. Параллельные воркеры не ждут друг
+друга на блокировках (`SKIP LOCKED`).
 """
-import asyncio
 import logging
+from collections.abc import Callable, Iterable, Sequence
 from datetime import datetime, timezone
+from typing import Any
 
 from sqlalchemy import select, update
 
+from app.config import settings
 from app.db import AsyncSessionLocal
 from app.models import Subscription, User
-from app.services.xui_client import XUIClient
+from app.services.change_notify import notify_subscription_changes
 from app.services.xui_sync import ensure_user_disabled
 
 logger = logging.getLogger(__name__)
 
 
-async def deactivate_expired_subscriptions() -> None:
-    """Однократно деактивировать все истекшие подписки."""
+async def _disable_clients(session, expired: Sequence[Any]) -> None:
+    """Отключить клиентов деактивированных подписок в 3X-UI."""
+    for row in expired:
+        user_uuid = getattr(row, "uuid", None)
+        if not user_uuid:
+            continue
+        try:
+            await ensure_user_disabled(session, str(user_uuid), include_disabled_servers=True)
+        except Exception as exc:
+            logger.exception(
+                "Не удалось отключить клиента в 3X-UI",
+                exc_info=exc,
+                extra={"subscription_id": row.id, "user_id": row.user_id},
+            )
+
+
+async def _deactivate_batch(
+    conditions: Sequence[Any],
+    limit: int,
+    on_tokens: Callable[[list[str]], None] | None = None,
+) -> list[Any]:
+    """Одна порция: UPDATE ... WHERE id IN (SELECT ... LIMIT n FOR UPDATE SKIP LOCKED) RETURNING."""
     now = datetime.now(timezone.utc)
+    candidates = (
+        select(Subscription.id)
+        .where(Subscription.is_active.is_(True))
+        .where(Subscription.expires_at <= now)
+        .where(*conditions)
+        .order_by(Subscription.expires_at)
+        .limit(limit)
+        # строки, которые сейчас держит другой воркер, достанутся ему
+        .with_for_update(skip_locked=True)
+    )
+    # Core по таблицам: ORM-update с UPDATE ... FROM выбрасывает users.uuid из RETURNING
+    subscriptions, users = Subscription.__table__, User.__table__
     async with AsyncSessionLocal() as session:
-        select_stmt = (
-            select(Subscription.id, Subscription.user_id, User.uuid)
-            .join(User, User.id == Subscription.user_id)
-            .where(Subscription.expires_at < now)
-            .where(Subscription.is_active.is_(True))
+        stmt = (
+            update(subscriptions)
+            .where(subscriptions.c.user_id == users.c.id)
+            .where(subscriptions.c.id.in_(candidates.scalar_subquery()))
+            .values(is_active=False)
+            .returning(subscriptions.c.id, subscriptions.c.user_id, subscriptions.c.token, users.c.uuid)
         )
-        expired = list((await session.execute(select_stmt)).all())
-        expired_ids = [row.id for row in expired]
+        expired = list((await session.execute(stmt)).all())
+        if not expired:
+            await session.rollback()
+            return []
+        tokens = [row.token for row in expired]
+        if on_tokens:
+            # до commit: собственный NOTIFY может прийти, пока отключаем клиентов в 3X-UI
+            on_tokens(tokens)
+        await notify_subscription_changes(session, tokens=tokens)
+        await session.commit()
+        logger.info("Деактивированы истекшие подписки", extra={"count": len(expired)})
+        await _disable_clients(session, expired)
+    return expired
 
-        if not expired_ids:
-            logger.info("Истекших подписок не найдено")
-            return
 
-        update_stmt = update(Subscription).where(Subscription.id.in_(expired_ids)).values(is_active=False)
-        await session.execute(update_stmt)
-        await session.commit()
-        logger.info("Деактивированы истекшие подписки", extra={"count": len(expired_ids)})
+async def _deactivate(
+    *conditions: Any,
+    batch_size: int | None = None,
+    on_batch: Callable[[int, int], None] | None = None,
+    on_tokens: Callable[[list[str]], None] | None = None,
+) -> int:
+    """Деактивировать истекшие подписки порциями: короткие транзакции, память не растет."""
+    limit = batch_size or settings.expiry_batch_size
+    total = 0
+    while True:
+        count = len(await _deactivate_batch(conditions, limit, on_tokens))
+        total += count
+        if on_batch and count:
+            on_batch(count, total)
+        if count < limit:
+            return total
 
-        client = XUIClient()
-        try:
-            for row in expired:
-                user_uuid = getattr(row, "uuid", None)
-                if not user_uuid:
-                    continue
-                try:
-                    await ensure_user_disabled(
-                        session,
-                        str(user_uuid),
-                        include_disabled_servers=True,
-                        xui_client=client,
-                    )
-                except Exception as exc:
-                    logger.exception(
-                        "Не удалось отключить клиента в 3X-UI",
-                        exc_info=exc,
-                        extra={"subscription_id": row.id, "user_id": row.user_id},
-                    )
-        finally:
-            await client.close()
 
+async def deactivate_subscriptions(
+    subscription_ids: Iterable[int],
+    on_tokens: Callable[[list[str]], None] | None = None,
+) -> int:
+    """Деактивировать подписки из списка, если они все еще активны и уже истекли.
 
-async def expired_subscriptions_loop(interval_hours: int = 24) -> None:
-    """Периодически запускает деактивацию. Останавливается при отмене таски."""
-    while True:
-        try:
-            await deactivate_expired_subscriptions()
-        except Exception as exc:  # не даем задаче упасть навсегда
-            logger.exception("Ошибка деактивации подписок", exc_info=exc)
-        await asyncio.sleep(interval_hours * 3600)
+    Продленные после постановки в очередь подписки условие `expires_at` пропустит.
+    `on_tokens` получает токены каждой порции до того, как придет их `NOTIFY`.
+    """
+    ids = list(subscription_ids)
+    if not ids:
+        return 0
+    return await _deactivate(Subscription.id.in_(ids), on_tokens=on_tokens)
+
+
+async def deactivate_expired_subscriptions(
+    batch_size: int | None = None,
+    on_batch: Callable[[int, int], None] | None = None,
+) -> int:
+    """Однократно деактивировать все истекшие подписки; `on_batch(порция, всего)` — прогресс."""
+    count = await _deactivate(batch_size=batch_size, on_batch=on_batch)
+    if not count:
+        logger.info("Истекших подписок не найдено")
+    return count
@@ -0,0 +1,119 @@
+"""Ограничение одновременных запросов по группам маршрутов.
+
+Без лимита всплеск `/sub` целиком встает в очередь пула SQLAlchemy внутри
+`get_session`, и задержка растет у всех, включая бота и админку. Каждая
+группа получает свой семафор: запрос ждет слот не дольше
+`CONCURRENCY_QUEUE_TIMEOUT_SECONDS`, иначе сразу получает 503. У бота и
+админки отдельная группа, поэтому публичный трафик не может занять их слоты.
+
+Лимиты по умолчанию делят между группами пул воркера (`DB_POOL_SIZE` +
+`DB_MAX_OVERFLOW` за вычетом `CONCURRENCY_DB_HEADROOM` для фоновых задач),
+явно заданные проверяются при старте: в сумме они не должны превышать его.
+"""
+import asyncio
+import time
+
+from app.config import settings
+
+GROUP_SUBSCRIPTION = "sub"
+GROUP_CLIENT = "client"
+GROUP_INTERNAL = "internal"
+
+# доли пула для групп без явного лимита
+_POOL_SHARES = {GROUP_SUBSCRIPTION: 0.5, GROUP_CLIENT: 0.3, GROUP_INTERNAL: 0.2}
+
+
+class Overloaded(Exception):
+    """Слот не освободился за отведенное время ожидания."""
+
+
+class ConcurrencyLimiter:
+    def __init__(self, name: str, limit: int, queue_timeout: float) -> None:
+        self.name = name
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.queued = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+
+    async def acquire(self) -> None:
+        """Занять слот или поднять `Overloaded`, если ждать дольше `queue_timeout`."""
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            self._admit()
+            return
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError as exc:
+            self.shed += 1
+            raise Overloaded(f"Группа {self.name} перегружена") from exc
+        finally:
+            self.waiting -= 1
+            waited = time.monotonic() - started
+            self.queued += 1
+            self.queue_wait_total += waited
+            self.queue_wait_max = max(self.queue_wait_max, waited)
+        self._admit()
+
+    def _admit(self) -> None:
+        self.admitted += 1
+        self.in_flight += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def snapshot(self) -> dict[str, float | int]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "queued": self.queued,
+            "queue_wait_avg_seconds": self.queue_wait_total / self.queued if self.queued else 0.0,
+            "queue_wait_max_seconds": self.queue_wait_max,
+        }
+
+
+def pool_capacity() -> int:
+    """Сколько соединений пула могут одновременно занять запросы."""
+    return settings.db_pool_size + settings.db_max_overflow - settings.concurrency_db_headroom
+
+
+def _resolve_limits() -> dict[str, int]:
+    configured = {
+        GROUP_SUBSCRIPTION: settings.concurrency_sub_limit,
+        GROUP_CLIENT: settings.concurrency_client_limit,
+        GROUP_INTERNAL: settings.concurrency_internal_limit,
+    }
+    capacity = pool_capacity()
+    return {
+        name: limit if limit is not None else max(1, int(capacity * _POOL_SHARES[name]))
+        for name, limit in configured.items()
+    }
+
+
+def check_pool_capacity() -> None:
+    """Остановить старт, если лимиты групп вместе больше пула БД."""
+    total = sum(limiter.limit for limiter in concurrency_limiters.values())
+    capacity = pool_capacity()
+    if total > capacity:
+        limits = ", ".join(f"{name}={limiter.limit}" for name, limiter in concurrency_limiters.items())
+        raise RuntimeError(
+            f"Лимиты CONCURRENCY_* ({limits}, всего {total}) больше пула БД: "
+            f"DB_POOL_SIZE + DB_MAX_OVERFLOW - CONCURRENCY_DB_HEADROOM = {capacity}"
+        )
+
+
+concurrency_limiters = {
+    name: ConcurrencyLimiter(name, limit, settings.concurrency_queue_timeout_seconds)
+    for name, limit in _resolve_limits().items()
+}
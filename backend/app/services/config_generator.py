@@ -1,5 +1,6 @@
 """Построение VLESS URI на лету."""
 import logging
+from dataclasses import dataclass
 from urllib.parse import urlencode
 
 from app.models.server import Server
@@ -7,11 +8,30 @@ from app.models.server import Server
 logger = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True)
+class CompiledServer:
+    """Проверенные поля сервера и заранее собранная VLESS-ссылка без UUID."""
+
+    server_id: int | None
+    label: str
+    host: str
+    port: int
+    network: str
+    public_key: str
+    sni: str
+    short_id: str
+    prefix: str
+    suffix: str
+
+    def render(self, user_uuid: str) -> str:
+        return f"{self.prefix}{user_uuid}{self.suffix}"
+
+
 class ConfigGenerator:
     """Генератор конфигураций без сохранения в базе."""
 
-    def build_vless_uri(self, server: Server, user_uuid: str) -> str:
-        """Собрать одну VLESS ссылку для конкретного сервера."""
+    def compile_server(self, server: Server) -> CompiledServer:
+        """Проверить сервер и собрать все части ссылки, кроме UUID пользователя."""
         protocol = server.protocol
         label = (server.country_code or server.host).upper()
 
@@ -59,4 +79,19 @@ class ConfigGenerator:
                 ("type", server.network),
             ]
         )
-        return f"{protocol}://{user_uuid}@{server.host}:{server.port}?{query}#{label}"
+        return CompiledServer(
+            server_id=getattr(server, "id", None),
+            label=label,
+            host=server.host,
+            port=int(server.port),
+            network=server.network,
+            public_key=server.public_key,
+            sni=server.sni,
+            short_id=server.short_id,
+            prefix=f"{protocol}://",
+            suffix=f"@{server.host}:{server.port}?{query}#{label}",
+        )
+
+    def build_vless_uri(self, server: Server, user_uuid: str) -> str:
+        """Собрать одну VLESS ссылку для конкретного сервера."""
+        return self.compile_server(server).render(user_uuid)
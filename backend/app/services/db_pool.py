@@ -0,0 +1,155 @@
+"""Настройки пула соединений SQLAlchemy, прогрев и счетчики пула.
+
+Общий для backend (параметры из `Settings`) и бота (те же переменные
+окружения через `PoolOptions.from_env`), поэтому не зависит от `app.config`.
+
+За PgBouncer в режиме transaction подготовленные выражения asyncpg живут
+на чужих серверных соединениях: `DB_PGBOUNCER=true` выключает оба кэша
+(asyncpg и диалекта SQLAlchemy) и дает выражениям уникальные имена.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections.abc import Mapping
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PoolOptions:
+    pool_size: int = 10
+    max_overflow: int = 10
+    pool_timeout: float = 10.0
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = False
+    statement_cache_size: int = 100
+    pgbouncer: bool = False
+    warmup: int | None = None  # None — прогреть весь pool_size
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] = os.environ) -> "PoolOptions":
+        """Те же `DB_*` переменные, что читает `Settings` backend."""
+        defaults = cls()
+
+        def _get(name: str, cast: Any, default: Any) -> Any:
+            raw = environ.get(name)
+            if raw is None or raw == "":
+                return default
+            if cast is bool:
+                return raw.strip().lower() in {"1", "true", "yes", "on"}
+            return cast(raw)
+
+        return cls(
+            pool_size=_get("DB_POOL_SIZE", int, defaults.pool_size),
+            max_overflow=_get("DB_MAX_OVERFLOW", int, defaults.max_overflow),
+            pool_timeout=_get("DB_POOL_TIMEOUT", float, defaults.pool_timeout),
+            pool_recycle=_get("DB_POOL_RECYCLE", int, defaults.pool_recycle),
+            pool_pre_ping=_get("DB_POOL_PRE_PING", bool, defaults.pool_pre_ping),
+            statement_cache_size=_get("DB_STATEMENT_CACHE_SIZE", int, defaults.statement_cache_size),
+            pgbouncer=_get("DB_PGBOUNCER", bool, defaults.pgbouncer),
+            warmup=_get("DB_POOL_WARMUP", int, defaults.warmup),
+        )
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Очередь пула, которая считает выдачи соединений и время их ожидания."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.checkout_wait_total = 0.0
+        self.checkout_wait_max = 0.0
+
+    def _do_get(self) -> Any:
+        started = time.monotonic()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.checkout_timeouts += 1
+            raise
+        finally:
+            waited = time.monotonic() - started
+            self.checkouts += 1
+            self.checkout_wait_total += waited
+            self.checkout_wait_max = max(self.checkout_wait_max, waited)
+
+    def recreate(self) -> "TimedQueuePool":
+        # dispose() пересоздает пул, счетчики переносим
+        pool = super().recreate()
+        for name in ("checkouts", "checkout_timeouts", "checkout_wait_total", "checkout_wait_max"):
+            setattr(pool, name, getattr(self, name))
+        return pool
+
+
+def _unique_statement_name() -> str:
+    return f"__asyncpg_{uuid.uuid4()}__"
+
+
+def create_pooled_engine(database_url: str, options: PoolOptions, **kwargs: Any) -> AsyncEngine:
+    connect_args: dict[str, Any] = {"statement_cache_size": options.statement_cache_size}
+    if options.pgbouncer:
+        connect_args = {
+            "statement_cache_size": 0,
+            # кэш подготовленных выражений адаптера asyncpg в SQLAlchemy
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": _unique_statement_name,
+        }
+    return create_async_engine(
+        database_url,
+        poolclass=TimedQueuePool,
+        pool_size=options.pool_size,
+        max_overflow=options.max_overflow,
+        pool_timeout=options.pool_timeout,
+        pool_recycle=options.pool_recycle,
+        pool_pre_ping=options.pool_pre_ping,
+        connect_args=connect_args,
+        **kwargs,
+    )
+
+
+async def warm_up(engine: AsyncEngine, options: PoolOptions) -> int:
+    """Открыть минимальный пул заранее, чтобы первый всплеск не ждал соединений."""
+    count = options.pool_size if options.warmup is None else min(options.warmup, options.pool_size)
+    if count <= 0:
+        return 0
+    started = time.monotonic()
+    async with AsyncExitStack() as stack:
+        connections = await asyncio.gather(*(stack.enter_async_context(engine.connect()) for _ in range(count)))
+        await asyncio.gather(*(connection.execute(text("SELECT 1")) for connection in connections))
+    logger.info(
+        "Пул соединений прогрет",
+        extra={"connections": count, "elapsed_ms": round((time.monotonic() - started) * 1000)},
+    )
+    return count
+
+
+def pool_gauges(engine: AsyncEngine) -> dict[str, float | int]:
+    pool = engine.sync_engine.pool
+    gauges: dict[str, float | int] = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        # QueuePool.overflow() отрицателен, пока пул не заполнен
+        "overflow": max(pool.overflow(), 0),
+    }
+    if isinstance(pool, TimedQueuePool):
+        gauges.update(
+            checkouts=pool.checkouts,
+            checkout_timeouts=pool.checkout_timeouts,
+            checkout_wait_avg_seconds=pool.checkout_wait_total / pool.checkouts if pool.checkouts else 0.0,
+            checkout_wait_max_seconds=pool.checkout_wait_max,
+        )
+    return gauges
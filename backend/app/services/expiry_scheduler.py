@@ -0,0 +1,217 @@
+"""Планировщик деактивации подписок точно по `expires_at`.
+
+Вместо суточного прохода по всей таблице держит в памяти min-heap ближайших
+истечений. Окно `EXPIRY_WINDOW_SECONDS` вперед читается порциями по
+частичному индексу `(expires_at, id) WHERE is_active`, планировщик спит до
+ближайшего срока и выключает подписку в пределах секунд после него.
+
+Новые и продленные подписки приходят уведомлением `subscription_changes`:
+в кучу добавляются только строки из payload (`token:`/`user:`) — один
+точечный запрос на все уведомления, накопленные с прошлого пробуждения.
+Уведомления о собственных деактивациях пропускаются, окно целиком
+перечитывается только по `*` и раз в `EXPIRY_RESYNC_SECONDS`. Записи в куче не проверяются: продленную подписку
+пропустит условие `expires_at <= now` в `deactivate_subscriptions`.
+Подписки, истекшие пока backend не работал, попадают в первое же окно.
+Планировщик работает в одном процессе на все воркеры и реплики (`job_runner`);
+остальные процессы его уведомления пропускают.
+"""
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import or_, select, tuple_
+
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.models import Subscription
+from app.services.cleanup_service import deactivate_subscriptions
+from app.services.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# имя задачи в job_runner (и ключ advisory lock) — общее для backend и `python -m app.jobs`
+EXPIRY_SCHEDULER_JOB = "expiry_scheduler"
+
+
+class ExpiryScheduler:
+    def __init__(
+        self,
+        window_seconds: float,
+        batch_size: int,
+        resync_seconds: float,
+        retry_delay: float = 30.0,
+    ) -> None:
+        self.window_seconds = window_seconds
+        self.batch_size = batch_size
+        self.resync_seconds = resync_seconds
+        self.retry_delay = retry_delay
+        # (expires_at, subscription_id)
+        self._heap: list[tuple[datetime, int]] = []
+        self._queued: set[tuple[datetime, int]] = set()
+        # до какой пары (expires_at, id) активные подписки уже в куче
+        self._cursor: tuple[datetime, int] | None = None
+        self._loaded_until: datetime | None = None
+        self._resync_at = 0.0
+        self._wake = asyncio.Event()
+        # уведомления нужны только лидеру: у ведомого их некому разбирать
+        self._running = False
+        # что изменилось с прошлого пробуждения (из payload уведомлений)
+        self._pending_tokens: set[str] = set()
+        self._pending_users: set[int] = set()
+        # токены, которые деактивировал сам планировщик: их NOTIFY ничего не меняет
+        self._own_tokens: TTLCache[str, bool] = TTLCache(max(batch_size * 10, 1000), 60.0)
+
+    def handle_notification(self, payload: str) -> None:
+        """Подписки создали или продлили: добавить их в кучу при ближайшем пробуждении."""
+        if not self._running:
+            return
+        for item in payload.split(","):
+            kind, _, value = item.partition(":")
+            if item == "*":
+                self._resync_at = 0.0
+            elif kind == "token" and value and not self._own_tokens.get(value):
+                self._pending_tokens.add(value)
+            elif kind == "user" and value.isdigit():
+                self._pending_users.add(int(value))
+        if len(self._pending_tokens) + len(self._pending_users) > self.batch_size:
+            # точечный запрос вышел бы больше окна — проще перечитать его
+            self._pending_tokens.clear()
+            self._pending_users.clear()
+            self._resync_at = 0.0
+        if self._resync_at == 0.0 or self._pending_tokens or self._pending_users:
+            self._wake.set()
+
+    def _remember_own(self, tokens: list[str]) -> None:
+        for token in tokens:
+            self._own_tokens.set(token, True)
+
+    def _push(self, expires_at: datetime, subscription_id: int) -> None:
+        entry = (expires_at, subscription_id)
+        if entry not in self._queued:
+            self._queued.add(entry)
+            heapq.heappush(self._heap, entry)
+
+    def _reset(self) -> None:
+        self._heap.clear()
+        self._queued.clear()
+        self._pending_tokens.clear()
+        self._pending_users.clear()
+        self._cursor = None
+        self._loaded_until = None
+        self._resync_at = time.monotonic() + self.resync_seconds
+
+    async def _load(self, now: datetime) -> None:
+        """Дочитать окно от курсора до now + window (порция за итерацию)."""
+        horizon = now + timedelta(seconds=self.window_seconds)
+        stmt = (
+            select(Subscription.expires_at, Subscription.id)
+            .where(Subscription.is_active.is_(True))
+            .where(Subscription.expires_at < horizon)
+            .order_by(Subscription.expires_at, Subscription.id)
+            .limit(self.batch_size)
+        )
+        if self._cursor is not None:
+            stmt = stmt.where(tuple_(Subscription.expires_at, Subscription.id) > tuple_(*self._cursor))
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(stmt)).all()
+        for expires_at, subscription_id in rows:
+            self._push(expires_at, subscription_id)
+        if rows:
+            self._cursor = (rows[-1].expires_at, rows[-1].id)
+        # порция неполная — окно дочитано до горизонта, иначе — до последней строки
+        self._loaded_until = horizon if len(rows) < self.batch_size else rows[-1].expires_at
+
+    async def _load_pending(self) -> None:
+        """Добавить в кучу измененные подписки, которые истекают в уже прочитанной части окна.
+
+        Более поздние подписки дочитает курсор, продленную старую запись отсеет
+        условие `expires_at` при деактивации.
+        """
+        tokens, users = list(self._pending_tokens), list(self._pending_users)
+        self._pending_tokens.clear()
+        self._pending_users.clear()
+        if self._loaded_until is None:
+            return
+        conditions = []
+        if tokens:
+            conditions.append(Subscription.token.in_(tokens))
+        if users:
+            conditions.append(Subscription.user_id.in_(users))
+        stmt = (
+            select(Subscription.expires_at, Subscription.id)
+            .where(Subscription.is_active.is_(True))
+            .where(Subscription.expires_at <= self._loaded_until)
+            .where(or_(*conditions))
+        )
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(stmt)).all()
+        for expires_at, subscription_id in rows:
+            self._push(expires_at, subscription_id)
+
+    def _pop_due(self, now: datetime) -> list[int]:
+        due: list[int] = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            self._queued.discard(entry)
+            due.append(entry[1])
+        return due
+
+    def _sleep_seconds(self, now: datetime) -> float:
+        if self._pending_tokens or self._pending_users:
+            return 0.0
+        deadlines = [self._resync_at - time.monotonic()]
+        if self._heap:
+            deadlines.append((self._heap[0][0] - now).total_seconds())
+        if self._loaded_until is not None:
+            deadlines.append((self._loaded_until - now).total_seconds())
+        return max(0.0, min(deadlines))
+
+    async def _tick(self) -> None:
+        if time.monotonic() >= self._resync_at:
+            self._reset()
+        now = datetime.now(timezone.utc)
+        if self._loaded_until is None or self._loaded_until <= now:
+            await self._load(now)
+        if self._pending_tokens or self._pending_users:
+            await self._load_pending()
+        due = self._pop_due(now)
+        if due:
+            await deactivate_subscriptions(due, on_tokens=self._remember_own)
+        now = datetime.now(timezone.utc)
+        if self._loaded_until is not None and self._loaded_until <= now:
+            return
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=self._sleep_seconds(now))
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self) -> None:
+        """Основной цикл; запускается через `job_runner` только в процессе-лидере."""
+        # новый лидер начинает с чистой кучи: пока он был ведомым, уведомления не копились
+        self._resync_at = 0.0
+        self._running = True
+        logger.info("Планировщик истечения подписок запущен", extra={"window_seconds": self.window_seconds})
+        try:
+            while True:
+                try:
+                    await self._tick()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:  # не даем задаче упасть навсегда
+                    logger.exception("Ошибка планировщика истечения подписок", exc_info=exc)
+                    self._reset()
+                    await asyncio.sleep(self.retry_delay)
+        finally:
+            self._running = False
+            self._pending_tokens.clear()
+            self._pending_users.clear()
+
+
+expiry_scheduler = ExpiryScheduler(
+    window_seconds=settings.expiry_window_seconds,
+    batch_size=settings.expiry_batch_size,
+    resync_seconds=settings.expiry_resync_seconds,
+)
@@ -0,0 +1,105 @@
+"""Фоновые задачи, которые должен выполнять ровно один процесс.
+
+Каждый воркер uvicorn и каждая реплика поднимают одинаковый `create_app`, и без
+координации фоновые задачи запускались бы в каждом процессе. `JobRunner`
+держит на каждую задачу отдельное соединение с Postgres и пытается взять
+session advisory lock с ключом из имени задачи: кто взял — выполняет задачу,
+остальные повторяют попытку раз в `JOBS_LOCK_RETRY_SECONDS`. Блокировка
+живет, пока живо соединение: если лидер упал или потерял связь с БД,
+Postgres отпускает ее сам, и задачу подхватывает другой процесс.
+
+Соединение блокировки идет напрямую в Postgres (`DATABASE_URL`): через
+PgBouncer в режиме transaction session-блокировки не работают.
+"""
+import asyncio
+import hashlib
+import logging
+from collections.abc import Awaitable, Callable
+
+import asyncpg
+
+from app.config import settings
+from app.services.change_notify import asyncpg_dsn
+
+logger = logging.getLogger(__name__)
+
+JobFunc = Callable[[], Awaitable[None]]
+
+
+def advisory_lock_key(name: str) -> int:
+    """Стабильный между процессами int8-ключ advisory lock для имени задачи."""
+    return int.from_bytes(hashlib.sha256(f"vpnbot:job:{name}".encode()).digest()[:8], "big", signed=True)
+
+
+class JobRunner:
+    def __init__(self, database_url: str, retry_seconds: float, heartbeat_seconds: float) -> None:
+        self._dsn = asyncpg_dsn(database_url)
+        self.retry_seconds = retry_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self._jobs: dict[str, JobFunc] = {}
+        self._tasks: list[asyncio.Task] = []
+        self.leading: set[str] = set()
+
+    def register(self, name: str, func: JobFunc) -> None:
+        """Зарегистрировать долгоживущую задачу (корутина не должна завершаться сама)."""
+        self._jobs[name] = func
+
+    async def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run(name, func)) for name, func in self._jobs.items()]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _lead(self, name: str, func: JobFunc, connection: asyncpg.Connection) -> None:
+        """Выполнять задачу, пока соединение с блокировкой живо."""
+        closed = asyncio.Event()
+        connection.add_termination_listener(lambda _conn: closed.set())
+        job = asyncio.create_task(func())
+        watcher = asyncio.create_task(closed.wait())
+        self.leading.add(name)
+        logger.info("Процесс стал лидером фоновой задачи", extra={"job": name})
+        try:
+            while True:
+                await asyncio.wait({job, watcher}, timeout=self.heartbeat_seconds, return_when=asyncio.FIRST_COMPLETED)
+                if job.done():
+                    job.result()
+                    logger.warning("Фоновая задача завершилась сама", extra={"job": name})
+                    return
+                if closed.is_set():
+                    raise ConnectionError("Соединение с блокировкой закрыто")
+                # без запроса разорванное соединение замечается только по TCP keepalive
+                await asyncio.wait_for(connection.fetchval("SELECT 1"), timeout=self.heartbeat_seconds)
+        finally:
+            self.leading.discard(name)
+            for task in (job, watcher):
+                task.cancel()
+            await asyncio.gather(job, watcher, return_exceptions=True)
+
+    async def _run(self, name: str, func: JobFunc) -> None:
+        key = advisory_lock_key(name)
+        while True:
+            try:
+                connection = await asyncpg.connect(self._dsn)
+                try:
+                    if await connection.fetchval("SELECT pg_try_advisory_lock($1)", key):
+                        await self._lead(name, func, connection)
+                finally:
+                    if not connection.is_closed():
+                        # close() отпускает и session-блокировку
+                        await connection.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Ошибка выполнения фоновой задачи", exc_info=exc, extra={"job": name})
+            await asyncio.sleep(self.retry_seconds)
+
+
+job_runner = JobRunner(
+    settings.database_url,
+    retry_seconds=settings.jobs_lock_retry_seconds,
+    heartbeat_seconds=settings.jobs_heartbeat_seconds,
+)
@@ -0,0 +1,200 @@
+"""Последние удачные ответы `/sub/{token}` для режима stale-if-error.
+
+Когда Postgres перезапускается или пул исчерпан, клиенты получали 500 и
+начинали повторять запросы еще чаще. Хранилище держит последний отданный
+ответ по (токен, формат) в памяти воркера и, опционально, в файле SQLite,
+который переживает рестарт и общий для воркеров одной ноды. Записи живут
+не дольше `SUB_STALE_IF_ERROR_SECONDS` и не дольше `expires_at` подписки;
+в памяти их не больше `SUB_LKG_MAX_SIZE` и `SUB_LKG_MAX_BYTES` по телам.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+from app.config import settings
+from app.services.subscription_renderer import FORMAT_BASE64, FORMAT_CLASH, FORMAT_PLAIN, FORMAT_SINGBOX
+from app.services.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS last_known_good (
+    key TEXT PRIMARY KEY,
+    etag TEXT NOT NULL,
+    body TEXT NOT NULL,
+    media_type TEXT NOT NULL,
+    headers TEXT NOT NULL,
+    expires_at INTEGER NOT NULL,
+    stored_at INTEGER NOT NULL
+)
+"""
+
+_KNOWN_FORMATS = (FORMAT_PLAIN, FORMAT_BASE64, FORMAT_CLASH, FORMAT_SINGBOX)
+
+
+@dataclass(frozen=True)
+class StaleResponse:
+    etag: str
+    body: str
+    media_type: str
+    headers: dict[str, str]
+    expires_at: int
+    stored_at: int
+
+    def is_servable(self, now: float, stale_seconds: float) -> bool:
+        return self.expires_at > now and now - self.stored_at < stale_seconds
+
+
+class _SQLiteFile:
+    """Файл SQLite с доступом из пула потоков; запросы короткие, блокировка общая."""
+
+    def __init__(self, path: str) -> None:
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=1000")
+        self._conn.execute(_SCHEMA)
+
+    def put(self, key: str, entry: StaleResponse) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO last_known_good VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    entry.etag,
+                    entry.body,
+                    entry.media_type,
+                    json.dumps(entry.headers),
+                    entry.expires_at,
+                    entry.stored_at,
+                ),
+            )
+
+    def get(self, key: str) -> StaleResponse | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, body, media_type, headers, expires_at, stored_at FROM last_known_good WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        etag, body, media_type, headers, expires_at, stored_at = row
+        return StaleResponse(etag, body, media_type, json.loads(headers), expires_at, stored_at)
+
+    def delete(self, keys: list[str]) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM last_known_good WHERE key = ?", [(key,) for key in keys])
+
+    def purge(self, now: float, stale_seconds: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM last_known_good WHERE expires_at <= ? OR stored_at <= ?",
+                (int(now), int(now - stale_seconds)),
+            )
+
+
+class LastKnownGoodStore:
+    def __init__(self, max_size: int, max_bytes: int, stale_seconds: float, path: str | None = None) -> None:
+        self.stale_seconds = stale_seconds
+        # тела подписок — ASCII, длина строки равна числу байт
+        self._memory: TTLCache[str, StaleResponse] = TTLCache(
+            max_size,
+            stale_seconds,
+            max_weight=max_bytes,
+            weigh=lambda entry: len(entry.body),
+        )
+        self._file = _SQLiteFile(path) if path and stale_seconds > 0 else None
+        self._tasks: set[asyncio.Task] = set()
+
+    @staticmethod
+    def _key(token: str, fmt: str) -> str:
+        return f"{fmt}:{token}"
+
+    def peek(self, token: str, fmt: str) -> bool:
+        """Есть ли в памяти ответ, который можно отдать (без обращения к файлу)."""
+        entry = self._memory.get(self._key(token, fmt))
+        return entry is not None and entry.is_servable(time.time(), self.stale_seconds)
+
+    def wants(self, token: str, fmt: str, etag: str) -> bool:
+        """Нужно ли тело ответа с этим ETag, чтобы запомнить его (в памяти такого еще нет)."""
+        if self.stale_seconds <= 0:
+            return False
+        entry = self._memory.get(self._key(token, fmt))
+        return entry is None or entry.etag != etag
+
+    async def remember(
+        self,
+        token: str,
+        fmt: str,
+        *,
+        etag: str,
+        body: str,
+        media_type: str,
+        headers: dict[str, str],
+        expires_at: int,
+    ) -> None:
+        """Запомнить удачный ответ; файл переписывается только при смене содержимого."""
+        if self.stale_seconds <= 0:
+            return
+        key = self._key(token, fmt)
+        now = time.time()
+        previous = self._memory.get(key)
+        entry = StaleResponse(etag, body, media_type, headers, expires_at, int(now))
+        self._memory.set(key, entry, ttl_seconds=min(self.stale_seconds, expires_at - now))
+        if self._file is None or (previous is not None and previous.etag == etag):
+            return
+        try:
+            await asyncio.to_thread(self._file.put, key, entry)
+        except sqlite3.Error as exc:
+            logger.warning("Не удалось сохранить ответ подписки на диск", exc_info=exc)
+
+    async def lookup(self, token: str, fmt: str) -> StaleResponse | None:
+        """Последний ответ, который еще можно отдать вместо ошибки."""
+        key = self._key(token, fmt)
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is None and self._file is not None:
+            try:
+                entry = await asyncio.to_thread(self._file.get, key)
+            except sqlite3.Error as exc:
+                logger.warning("Не удалось прочитать ответ подписки с диска", exc_info=exc)
+        if entry is None or not entry.is_servable(now, self.stale_seconds):
+            return None
+        return entry
+
+    def forget(self, token: str) -> None:
+        keys = [self._key(token, fmt) for fmt in _KNOWN_FORMATS]
+        for key in keys:
+            self._memory.pop(key)
+        if self._file is not None:
+            self._spawn(asyncio.to_thread(self._file.delete, keys))
+
+    def handle_notification(self, payload: str) -> None:
+        """Измененные подписки больше не отдаем устаревшими (канал `subscription_changes`)."""
+        for item in payload.split(","):
+            kind, _, value = item.partition(":")
+            if kind == "token" and value:
+                self.forget(value)
+
+    async def purge_file(self) -> None:
+        """Удалить из файла записи, которые уже нельзя отдать."""
+        if self._file is not None:
+            await asyncio.to_thread(self._file.purge, time.time(), self.stale_seconds)
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+last_known_good = LastKnownGoodStore(
+    max_size=settings.sub_lkg_max_size,
+    max_bytes=settings.sub_lkg_max_bytes,
+    stale_seconds=settings.sub_stale_if_error_seconds,
+    path=settings.sub_lkg_path,
+)
@@ -0,0 +1,106 @@
+"""Token bucket для ограничения частоты запросов к `/sub` и API бота.
+
+Лимит задается строкой `<емкость>/<секунды>`: ведро на `емкость` запросов,
+полностью восполняется за `секунды`. По умолчанию ведра живут в памяти
+воркера; с `RATE_LIMIT_REDIS_URL` — в Redis, общие для всех реплик (Lua-скрипт
+считает атомарно по часам Redis). Если Redis недоступен, воркер временно
+считает сам, а не пропускает всех подряд.
+"""
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from redis import asyncio as redis
+from redis.exceptions import RedisError
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_REDIS_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(retry_after)
+"""
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    capacity: int
+    refill_per_second: float
+
+
+def parse_rate_limit(value: str) -> RateLimit | None:
+    """`30/600` -> RateLimit(30, 0.05); пустая строка или `0/...` — без лимита."""
+    value = value.strip()
+    if not value:
+        return None
+    capacity, sep, seconds = value.partition("/")
+    if not sep:
+        raise ValueError(f"Некорректный лимит запросов: {value}")
+    capacity_value, seconds_value = int(capacity), float(seconds)
+    if capacity_value <= 0:
+        return None
+    if seconds_value <= 0:
+        raise ValueError(f"Некорректный лимит запросов: {value}")
+    return RateLimit(capacity=capacity_value, refill_per_second=capacity_value / seconds_value)
+
+
+class RateLimiter:
+    def __init__(self, max_keys: int, redis_url: str | None = None, key_prefix: str = "rl:") -> None:
+        self.max_keys = max_keys
+        self.key_prefix = key_prefix
+        # ключ -> (токенов в ведре, время последнего пересчета)
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._redis = redis.from_url(redis_url) if redis_url else None
+        self._script = self._redis.register_script(_REDIS_BUCKET_SCRIPT) if self._redis else None
+
+    def _hit_local(self, key: str, limit: RateLimit) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (float(limit.capacity), now))
+        tokens = min(float(limit.capacity), tokens + (now - updated) * limit.refill_per_second)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / limit.refill_per_second
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    async def hit(self, key: str, limit: RateLimit) -> float:
+        """Списать запрос; 0 — можно, иначе через сколько секунд повторить."""
+        if self._script is not None:
+            try:
+                result = await self._script(
+                    keys=[f"{self.key_prefix}{key}"],
+                    args=[limit.capacity, limit.refill_per_second],
+                )
+                return float(result)
+            except RedisError as exc:
+                logger.warning("Redis недоступен, лимит запросов считается локально", exc_info=exc)
+        return self._hit_local(key, limit)
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+
+
+rate_limiter = RateLimiter(max_keys=settings.rate_limit_max_keys, redis_url=settings.rate_limit_redis_url)
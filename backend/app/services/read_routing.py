@@ -0,0 +1,68 @@
+"""Чтение с реплики и read-your-writes.
+
+С `DATABASE_READ_URL` читающие маршруты (`/sub`, `/api/me/*`, бот, список
+серверов) берут сессию `get_read_session`: SELECT уходят на реплику, а запись
+и flush — на primary. Реплика отстает, поэтому ключи, про которые пришло
+уведомление об изменении, на `READ_YOUR_WRITES_SECONDS` закрепляются за
+primary: иначе кэш, сброшенный по `NOTIFY`, тут же заполнился бы старыми
+данными реплики. Ключи те же, что в payload канала `subscription_changes`
+(`token:<token>`, `user:<user_id>`), плюс `servers` для каталога серверов.
+"""
+import time
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.services.ttl_cache import TTLCache
+
+# session.info: сессия чтения закреплена за primary
+USE_PRIMARY = "use_primary"
+SERVERS_KEY = "servers"
+
+
+def pin_primary(session: AsyncSession) -> None:
+    """Читать в этой сессии с primary (до первого запроса сессии)."""
+    session.info[USE_PRIMARY] = True
+
+
+class RecentWrites:
+    def __init__(self, window_seconds: float, max_size: int) -> None:
+        self.window_seconds = window_seconds
+        self._keys: TTLCache[str, bool] = TTLCache(max_size, window_seconds)
+        self._all_until = 0.0
+
+    def mark(self, *keys: str) -> None:
+        for key in keys:
+            self._keys.set(key, True)
+
+    def mark_all(self) -> None:
+        self._all_until = time.monotonic() + self.window_seconds
+
+    def is_recent(self, *keys: str) -> bool:
+        if self._all_until > time.monotonic():
+            return True
+        return any(self._keys.get(key) for key in keys)
+
+    def route(self, session: AsyncSession, *keys: str) -> None:
+        """Закрепить сессию за primary, если любой из ключей недавно меняли."""
+        if self.is_recent(*keys):
+            pin_primary(session)
+
+    def handle_notification(self, payload: str) -> None:
+        """Канал `subscription_changes`: запомнить измененные токены и пользователей."""
+        for item in payload.split(","):
+            if item == "*":
+                # в том числе переподключение LISTEN: что пропустили, неизвестно
+                self.mark_all()
+            elif item:
+                self.mark(item)
+
+    def handle_server_notification(self, payload: str) -> None:
+        """Канал `server_changes`: каталог перечитываем с primary."""
+        self.mark(SERVERS_KEY)
+
+
+recent_writes = RecentWrites(
+    window_seconds=settings.read_your_writes_seconds,
+    max_size=settings.token_cache_max_size,
+)
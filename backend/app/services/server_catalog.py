@@ -0,0 +1,134 @@
+"""Кэш каталога серверов с заранее собранными VLESS-шаблонами.
+
+Таблица `servers` меняется только из админки, а `/sub/{token}`, сводки
+подписки и синхронизация с 3X-UI читали её на каждый вызов. Каталог держит
+неизменяемый снимок в памяти процесса: скомпилированные включенные серверы,
+их количество и inbound_id без дублей. Снимок пересобирается после CRUD в
+`ServerService` (в остальных воркерах — по уведомлению `server_changes`) и
+не реже раза в TTL как страховка от потерянных уведомлений.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import Server
+from app.services.config_generator import CompiledServer, ConfigGenerator
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ServerCatalogSnapshot:
+    """Неизменяемый снимок включенных серверов."""
+
+    version: int
+    servers: tuple[CompiledServer, ...]
+    skipped: int = 0
+    error: str | None = None
+    # одинаков во всех воркерах при одинаковых серверах, в отличие от version
+    fingerprint: str = ""
+    # включенные серверы с inbound_id, включая не прошедшие компиляцию
+    enabled_count: int = 0
+    # inbound_id включенных серверов и всех серверов, порядок по id без дублей
+    inbound_ids: tuple[int, ...] = ()
+    all_inbound_ids: tuple[int, ...] = ()
+
+    def render_links(self, user_uuid: str) -> list[str]:
+        return [server.render(user_uuid) for server in self.servers]
+
+
+class ServerCatalog:
+    def __init__(self, ttl_seconds: float, config_generator: ConfigGenerator | None = None) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.config_generator = config_generator or ConfigGenerator()
+        self._snapshot: ServerCatalogSnapshot | None = None
+        self._loaded_at = 0.0
+        self._version = 0
+        self._generation = 0
+        self._loaded_generation = -1
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        """Пометить снимок устаревшим, следующий запрос перечитает серверы."""
+        self._generation += 1
+        logger.info("Каталог серверов помечен устаревшим", extra={"generation": self._generation})
+
+    def handle_notification(self, payload: str) -> None:
+        """Обработчик канала `server_changes` для `ChangeListener`."""
+        self.invalidate()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def _is_fresh(self) -> bool:
+        if self._snapshot is None or self._loaded_generation != self._generation:
+            return False
+        return time.monotonic() - self._loaded_at < self.ttl_seconds
+
+    def current(self) -> ServerCatalogSnapshot | None:
+        """Снимок без обращения к БД или `None`, если его пора перечитать."""
+        return self._snapshot if self._is_fresh() else None
+
+    async def get(self, session: AsyncSession) -> ServerCatalogSnapshot:
+        """Вернуть актуальный снимок, при необходимости перечитав таблицу."""
+        if self._is_fresh():
+            return self._snapshot  # type: ignore[return-value]
+
+        async with self._lock:
+            if self._is_fresh():
+                return self._snapshot  # type: ignore[return-value]
+            # если инвалидация придет во время загрузки, снимок сразу останется устаревшим
+            generation = self._generation
+            stmt = select(Server).order_by(Server.id)
+            result = await session.execute(stmt)
+            return self.publish(list(result.scalars().all()), generation)
+
+    def publish(self, all_servers: Sequence[Any], generation: int) -> ServerCatalogSnapshot:
+        """Скомпилировать серверы (ORM или строки с теми же полями) в новый снимок."""
+        enabled_servers = [server for server in all_servers if server.enabled]
+        servers = [server for server in enabled_servers if server.inbound_id is not None]
+
+        compiled: list[CompiledServer] = []
+        error: str | None = None
+        for server in servers:
+            try:
+                compiled.append(self.config_generator.compile_server(server))
+            except ValueError as exc:
+                error = error or str(exc)
+
+        digest = hashlib.sha256()
+        for item in compiled:
+            digest.update(f"{item.prefix}\0{item.suffix}\n".encode())
+
+        self._version += 1
+        snapshot = ServerCatalogSnapshot(
+            version=self._version,
+            servers=tuple(compiled),
+            skipped=len(enabled_servers) - len(servers),
+            error=error,
+            fingerprint=digest.hexdigest()[:16],
+            enabled_count=len(servers),
+            inbound_ids=tuple(dict.fromkeys(server.inbound_id for server in servers)),
+            all_inbound_ids=tuple(
+                dict.fromkeys(server.inbound_id for server in all_servers if server.inbound_id is not None)
+            ),
+        )
+        self._snapshot = snapshot
+        self._loaded_at = time.monotonic()
+        self._loaded_generation = generation
+        logger.info(
+            "Каталог серверов загружен",
+            extra={"version": snapshot.version, "servers_count": len(compiled), "skipped": snapshot.skipped},
+        )
+        return snapshot
+
+
+server_catalog = ServerCatalog(ttl_seconds=settings.server_catalog_ttl_seconds)
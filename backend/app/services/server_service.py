@@ -6,6 +6,8 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import Server
+from app.services.change_notify import notify_server_changes
+from app.services.server_catalog import server_catalog
 
 logger = logging.getLogger(__name__)
 
@@ -27,7 +29,9 @@ class ServerService:
     async def create_server(self, data: dict[str, Any]) -> Server:
         server = Server(**data)
         self.session.add(server)
+        await notify_server_changes(self.session)
         await self.session.commit()
+        server_catalog.invalidate()
         await self.session.refresh(server)
         logger.info(
             "Создан сервер",
@@ -51,7 +55,9 @@ class ServerService:
         server = await self._get_server(server_id)
         for field, value in data.items():
             setattr(server, field, value)
+        await notify_server_changes(self.session)
         await self.session.commit()
+        server_catalog.invalidate()
         await self.session.refresh(server)
         logger.info(
             "Обновлен сервер",
@@ -62,5 +68,7 @@ class ServerService:
     async def delete_server(self, server_id: int) -> None:
         server = await self._get_server(server_id)
         await self.session.delete(server)
+        await notify_server_changes(self.session)
         await self.session.commit()
+        server_catalog.invalidate()
         logger.info("Удален сервер", extra={"server_id": server_id})
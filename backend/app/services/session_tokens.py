@@ -0,0 +1,86 @@
+"""Короткоживущие сессионные токены Mini App.
+
+`/api/auth/telegram` один раз проверяет initData и выдает токен с
+user_id, tg_id, ролью и флагом активности. Дальше Mini App ходит с
+`Authorization: Bearer <token>`, который проверяется HMAC без БД.
+Продление токена сохраняет `auth_date` исходной initData, поэтому сессия
+не живет дольше `SESSION_MAX_AGE_SECONDS` от нее: дальше нужна новая initData.
+Формат: `<claims base64url JSON>.<HMAC-SHA256 base64url>`.
+"""
+import hashlib
+import hmac
+import json
+import time
+from dataclasses import asdict, dataclass
+
+from app.config import settings
+from app.services.token_signing import b64url_decode, b64url_encode
+
+
+class InvalidSessionToken(Exception):
+    """Сессионный токен поврежден, подделан или истек."""
+
+
+@dataclass(frozen=True)
+class SessionClaims:
+    user_id: int
+    tg_id: int
+    role: str
+    is_active: bool
+    # auth_date initData, по которой начата сессия
+    auth_date: int
+    exp: int
+
+    def seconds_left(self) -> float:
+        return self.exp - time.time()
+
+
+def session_deadline(auth_date: int) -> int:
+    """Абсолютный срок сессии, начатой по initData с этим `auth_date`."""
+    return auth_date + settings.session_max_age_seconds
+
+
+def _session_secret() -> bytes:
+    if settings.session_secret:
+        return settings.session_secret.encode()
+    # без явного секрета выводим его из токена бота, отдельно от ключа WebAppData
+    return hmac.new(b"MiniAppSession", settings.bot_token.encode(), hashlib.sha256).digest()
+
+
+_SECRET = _session_secret()
+
+
+def _mac(body: str) -> str:
+    return b64url_encode(hmac.new(_SECRET, body.encode(), hashlib.sha256).digest())
+
+
+def issue_session_token(
+    user_id: int,
+    tg_id: int,
+    role: str,
+    is_active: bool,
+    auth_date: int,
+) -> tuple[str, SessionClaims]:
+    claims = SessionClaims(
+        user_id=user_id,
+        tg_id=tg_id,
+        role=role,
+        is_active=is_active,
+        auth_date=auth_date,
+        exp=min(int(time.time()) + settings.session_token_ttl_seconds, session_deadline(auth_date)),
+    )
+    body = b64url_encode(json.dumps(asdict(claims), separators=(",", ":")).encode())
+    return f"{body}.{_mac(body)}", claims
+
+
+def verify_session_token(token: str) -> SessionClaims:
+    body, sep, mac = token.partition(".")
+    if not sep or not hmac.compare_digest(mac, _mac(body)):
+        raise InvalidSessionToken("Некорректная подпись сессии")
+    try:
+        claims = SessionClaims(**json.loads(b64url_decode(body)))
+    except (ValueError, TypeError) as exc:
+        raise InvalidSessionToken("Некорректное содержимое сессии") from exc
+    if claims.seconds_left() <= 0:
+        raise InvalidSessionToken("Сессия истекла")
+    return claims
@@ -0,0 +1,90 @@
+"""Чтение подписки для `/sub/{token}` одним запросом напрямую через asyncpg.
+
+Подписка, состояние пользователя и (если каталог устарел) все серверы
+приходят одной строкой: без ORM-объектов и без отдельных
+round trip'ов на selectin и `servers`. asyncpg сам кэширует подготовленный
+statement на соединении.
+"""
+import json
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.token_cache import CachedSubscription
+
+_SUBSCRIPTION_BUNDLE_SQL = """
+WITH sub AS (
+    SELECT s.id, s.user_id, s.expires_at, s.is_active, u.uuid, u.is_active AS user_is_active
+    FROM subscriptions AS s
+    JOIN users AS u ON u.id = s.user_id
+    WHERE s.token = $1
+)
+SELECT
+    sub.id,
+    sub.user_id,
+    sub.expires_at,
+    sub.is_active,
+    sub.uuid,
+    sub.user_is_active,
+    CASE WHEN $2::boolean THEN (
+        SELECT coalesce(json_agg(srv ORDER BY srv.id), '[]'::json)
+        FROM (
+            SELECT id, country_code, host, port, protocol, network, inbound_id, public_key, sni, short_id, enabled
+            FROM servers
+        ) AS srv
+    ) END AS servers
+FROM (SELECT 1) AS one
+LEFT JOIN sub ON true
+"""
+
+
+@dataclass(frozen=True)
+class ServerRow:
+    """Поля сервера, нужные `ConfigGenerator`, без ORM."""
+
+    id: int
+    country_code: str
+    host: str
+    port: int
+    protocol: str
+    network: str
+    inbound_id: int | None
+    public_key: str
+    sni: str | None
+    short_id: str
+    enabled: bool
+
+
+@dataclass(frozen=True)
+class SubscriptionBundle:
+    subscription: CachedSubscription | None
+    servers: list[ServerRow] | None
+
+
+async def _driver_connection(session: AsyncSession) -> Any:
+    connection = await session.connection()
+    raw = await connection.get_raw_connection()
+    return raw.driver_connection
+
+
+async def fetch_subscription_bundle(session: AsyncSession, token: str, *, with_servers: bool) -> SubscriptionBundle:
+    """Один round trip: подписка по токену и, при `with_servers`, все серверы для каталога."""
+    driver = await _driver_connection(session)
+    row = await driver.fetchrow(_SUBSCRIPTION_BUNDLE_SQL, token, with_servers)
+
+    subscription = None
+    if row["id"] is not None:
+        subscription = CachedSubscription(
+            subscription_id=row["id"],
+            user_id=row["user_id"],
+            user_uuid=str(row["uuid"]),
+            expires_at=row["expires_at"],
+            is_active=row["is_active"],
+            user_is_active=row["user_is_active"],
+        )
+
+    servers = None
+    if row["servers"] is not None:
+        servers = [ServerRow(**item) for item in json.loads(row["servers"])]
+    return SubscriptionBundle(subscription=subscription, servers=servers)
@@ -0,0 +1,195 @@
+"""Рендер подписки в форматы разных клиентов из скомпилированного каталога.
+
+Серверная часть каждого формата (YAML для Clash/Mihomo, JSON для sing-box)
+сериализуется один раз на версию каталога с маркером вместо UUID и
+режется по нему на сегменты; на запрос остается склеить сегменты с UUID.
+"""
+import base64
+import json
+import logging
+from dataclasses import dataclass
+
+import yaml
+
+from app.config import settings
+from app.services.config_generator import CompiledServer
+from app.services.server_catalog import ServerCatalogSnapshot
+
+logger = logging.getLogger(__name__)
+
+FORMAT_PLAIN = "plain"
+FORMAT_BASE64 = "base64"
+FORMAT_CLASH = "clash"
+FORMAT_SINGBOX = "singbox"
+
+_FORMAT_ALIASES = {
+    "plain": FORMAT_PLAIN,
+    "raw": FORMAT_PLAIN,
+    "base64": FORMAT_BASE64,
+    "b64": FORMAT_BASE64,
+    "v2ray": FORMAT_BASE64,
+    "clash": FORMAT_CLASH,
+    "mihomo": FORMAT_CLASH,
+    "meta": FORMAT_CLASH,
+    "singbox": FORMAT_SINGBOX,
+    "sing-box": FORMAT_SINGBOX,
+}
+
+# подстроки User-Agent в нижнем регистре, порядок важен
+_USER_AGENT_FORMATS = (
+    ("sing-box", FORMAT_SINGBOX),
+    ("sfa/", FORMAT_SINGBOX),
+    ("sfi/", FORMAT_SINGBOX),
+    ("sfm/", FORMAT_SINGBOX),
+    ("mihomo", FORMAT_CLASH),
+    ("clash", FORMAT_CLASH),
+    ("stash", FORMAT_CLASH),
+)
+
+_MEDIA_TYPES = {
+    FORMAT_PLAIN: "text/plain",
+    FORMAT_BASE64: "text/plain",
+    FORMAT_CLASH: "text/yaml",
+    FORMAT_SINGBOX: "application/json",
+}
+
+# маркер UUID при сериализации шаблона; в данных серверов встретиться не может
+_UUID_MARKER = "__SUBSCRIPTION_USER_UUID__"
+
+
+class UnknownSubscriptionFormat(ValueError):
+    """Запрошен неизвестный формат подписки."""
+
+
+class NoCompatibleServers(Exception):
+    """Ни один включенный сервер не поддерживается запрошенным форматом."""
+
+
+def detect_format(requested: str | None, user_agent: str | None) -> str:
+    """Формат из `?format=`, иначе по User-Agent клиента, иначе plain."""
+    if requested:
+        fmt = _FORMAT_ALIASES.get(requested.strip().lower())
+        if fmt is None:
+            raise UnknownSubscriptionFormat(f"Неизвестный формат подписки: {requested}")
+        return fmt
+    agent = (user_agent or "").lower()
+    for needle, fmt in _USER_AGENT_FORMATS:
+        if needle in agent:
+            return fmt
+    return FORMAT_PLAIN
+
+
+@dataclass(frozen=True)
+class RenderedSubscription:
+    body: str
+    media_type: str
+
+    @classmethod
+    def for_format(cls, body: str, fmt: str) -> "RenderedSubscription":
+        return cls(body=body, media_type=_MEDIA_TYPES[fmt])
+
+
+def _unique_labels(servers: tuple[CompiledServer, ...]) -> list[str]:
+    """Clash и sing-box требуют уникальные имена, а country_code может повторяться."""
+    seen: dict[str, int] = {}
+    labels = []
+    for server in servers:
+        count = seen.get(server.label, 0) + 1
+        seen[server.label] = count
+        labels.append(server.label if count == 1 else f"{server.label} {count}")
+    return labels
+
+
+def _clash_document(servers: tuple[CompiledServer, ...]) -> dict:
+    proxies = []
+    for server, name in zip(servers, _unique_labels(servers)):
+        proxy = {
+            "name": name,
+            "type": "vless",
+            "server": server.host,
+            "port": server.port,
+            "uuid": _UUID_MARKER,
+            "network": server.network,
+            "udp": True,
+            "tls": True,
+            "servername": server.sni,
+            "client-fingerprint": "chrome",
+            "reality-opts": {"public-key": server.public_key, "short-id": server.short_id},
+        }
+        proxies.append(proxy)
+    group = settings.sub_profile_title
+    return {
+        "mixed-port": 7890,
+        "mode": "rule",
+        "proxies": proxies,
+        "proxy-groups": [{"name": group, "type": "select", "proxies": [proxy["name"] for proxy in proxies]}],
+        "rules": [f"MATCH,{group}"],
+    }
+
+
+def _singbox_document(servers: tuple[CompiledServer, ...]) -> dict:
+    outbounds = []
+    for server, tag in zip(servers, _unique_labels(servers)):
+        if server.network == "xhttp":
+            logger.warning(
+                "sing-box не поддерживает xhttp, сервер пропущен",
+                extra={"server_id": server.server_id},
+            )
+            continue
+        outbound = {
+            "type": "vless",
+            "tag": tag,
+            "server": server.host,
+            "server_port": server.port,
+            "uuid": _UUID_MARKER,
+            "tls": {
+                "enabled": True,
+                "server_name": server.sni,
+                "utls": {"enabled": True, "fingerprint": "chrome"},
+                "reality": {"enabled": True, "public_key": server.public_key, "short_id": server.short_id},
+            },
+        }
+        if server.network == "ws":
+            outbound["transport"] = {"type": "ws"}
+        outbounds.append(outbound)
+    if not outbounds:
+        # селектор без outbounds sing-box не загрузит, а direct молча пустил бы трафик мимо VPN
+        raise NoCompatibleServers("Нет серверов, которые поддерживает sing-box")
+    selector = {"type": "selector", "tag": "proxy", "outbounds": [item["tag"] for item in outbounds]}
+    return {
+        "outbounds": [selector, *outbounds, {"type": "direct", "tag": "direct"}],
+        "route": {"final": "proxy"},
+    }
+
+
+class SubscriptionRenderer:
+    def __init__(self) -> None:
+        # формат -> (версия каталога, сегменты шаблона)
+        self._templates: dict[str, tuple[int, tuple[str, ...]]] = {}
+
+    def _segments(self, fmt: str, catalog: ServerCatalogSnapshot) -> tuple[str, ...]:
+        cached = self._templates.get(fmt)
+        if cached and cached[0] == catalog.version:
+            return cached[1]
+
+        if fmt == FORMAT_CLASH:
+            text = yaml.safe_dump(_clash_document(catalog.servers), allow_unicode=True, sort_keys=False)
+        elif fmt == FORMAT_SINGBOX:
+            text = json.dumps(_singbox_document(catalog.servers), ensure_ascii=False, indent=2)
+        else:
+            text = "\n".join(catalog.render_links(_UUID_MARKER))
+        segments = tuple(text.split(_UUID_MARKER))
+        self._templates[fmt] = (catalog.version, segments)
+        logger.info("Шаблон подписки собран", extra={"format": fmt, "catalog_version": catalog.version})
+        return segments
+
+    def render(self, catalog: ServerCatalogSnapshot, user_uuid: str, fmt: str = FORMAT_PLAIN) -> RenderedSubscription:
+        if fmt == FORMAT_BASE64:
+            plain = user_uuid.join(self._segments(FORMAT_PLAIN, catalog))
+            body = base64.b64encode(plain.encode()).decode()
+        else:
+            body = user_uuid.join(self._segments(fmt, catalog))
+        return RenderedSubscription.for_format(body, fmt)
+
+
+subscription_renderer = SubscriptionRenderer()
@@ -1,14 +1,24 @@
 """Бизнес-логика подписки и выдачи конфигов."""
 import logging
+from dataclasses import dataclass, replace
 from datetime import datetime, timezone
-from typing import List
 
-from sqlalchemy import func, select
+from sqlalchemy import select, true
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import aliased
 
-from app.models import Server, Subscription, User
-from app.services.config_generator import ConfigGenerator
+from app.models import Subscription, User
+from app.services.server_catalog import ServerCatalog, ServerCatalogSnapshot, server_catalog
+from app.services.subscription_query import fetch_subscription_bundle
+from app.services.subscription_renderer import FORMAT_PLAIN, RenderedSubscription, subscription_renderer
+from app.services.subscription_store import SubscriptionStore, subscription_store
+from app.services.token_cache import CachedSubscription, SubscriptionTokenCache, token_cache
+from app.services.token_signing import (
+    InvalidSubscriptionToken,
+    SubscriptionTokenSigner,
+    TokenClaims,
+    subscription_token_signer,
+)
 from app.config import settings
 
 logger = logging.getLogger(__name__)
@@ -22,35 +32,113 @@ class NoActiveServers(Exception):
     """Нет доступных серверов для генерации конфигов."""
 
 
+@dataclass(frozen=True)
+class SubscriptionPayload:
+    subscription: CachedSubscription
+    catalog: ServerCatalogSnapshot
+    # тело, уже взятое из Redis или отрендеренное для записи в него
+    stored: RenderedSubscription | None = None
+    stored_format: str | None = None
+
+    @property
+    def version_key(self) -> tuple:
+        """Всё, от чего зависит ответ `/sub/{token}`: основа для ETag."""
+        return (
+            self.catalog.fingerprint,
+            self.subscription.subscription_id,
+            self.subscription.user_uuid,
+            int(self.subscription.expires_at.timestamp()),
+        )
+
+    def render(self, fmt: str = FORMAT_PLAIN) -> RenderedSubscription:
+        if self.stored is not None and fmt == self.stored_format:
+            return self.stored
+        logger.info(
+            "Генерация payload подписки",
+            extra={
+                "subscription_id": self.subscription.subscription_id,
+                "user_id": self.subscription.user_id,
+                "servers_count": len(self.catalog.servers),
+                "catalog_version": self.catalog.version,
+                "format": fmt,
+            },
+        )
+        return subscription_renderer.render(self.catalog, self.subscription.user_uuid, fmt)
+
+
+@dataclass(frozen=True)
+class _StoreLookup:
+    body: str | None
+
+
 class SubscriptionService:
-    def __init__(self, session: AsyncSession, config_generator: ConfigGenerator | None = None) -> None:
+    def __init__(
+        self,
+        session: AsyncSession,
+        catalog: ServerCatalog | None = None,
+        cache: SubscriptionTokenCache | None = None,
+        signer: SubscriptionTokenSigner | None = None,
+        store: SubscriptionStore | None = None,
+    ) -> None:
         self.session = session
-        self.config_generator = config_generator or ConfigGenerator()
+        self.server_catalog = catalog or server_catalog
+        self.token_cache = cache or token_cache
+        self.token_signer = signer or subscription_token_signer
+        self.subscription_store = store or subscription_store
 
-    async def _get_active_subscription(self, token: str) -> Subscription:
-        stmt = (
-            select(Subscription)
-            .options(selectinload(Subscription.user))
-            .where(Subscription.token == token)
-        )
-        result = await self.session.execute(stmt)
-        subscription: Subscription | None = result.scalar_one_or_none()
-        now = datetime.now(timezone.utc)
+    async def _resolve(
+        self, token: str, fmt: str | None = None
+    ) -> tuple[CachedSubscription | None, ServerCatalogSnapshot, _StoreLookup | None]:
+        """Подписка и каталог: память воркера, затем Redis, при промахе — один запрос на оба.
 
+        Третий элемент — `None`, если ответ собран из памяти и Redis не трогали.
+        """
+        found, subscription = self.token_cache.lookup(token)
+        catalog = self.server_catalog.current()
+        if found and catalog is not None:
+            return subscription, catalog, None
+
+        if catalog is not None and fmt is not None and self.subscription_store.enabled:
+            token_generation = self.token_cache.generation
+            stored, body = await self.subscription_store.fetch(token, catalog.fingerprint, fmt)
+            if stored is not None:
+                self.token_cache.store(token, stored, token_generation)
+                return stored, catalog, _StoreLookup(body=body)
+
+        token_generation = self.token_cache.generation
+        catalog_generation = self.server_catalog.generation
+        bundle = await fetch_subscription_bundle(self.session, token, with_servers=catalog is None)
+        if not found:
+            subscription = bundle.subscription
+            self.token_cache.store(token, subscription, token_generation)
+        if catalog is None:
+            catalog = self.server_catalog.publish(bundle.servers or [], catalog_generation)
+        return subscription, catalog, _StoreLookup(body=None)
+
+    def _verify_token_signature(self, token: str) -> TokenClaims | None:
+        """Отсечь поддельные и заведомо истекшие токены до любого запроса в БД."""
+        try:
+            return self.token_signer.verify(token)
+        except InvalidSubscriptionToken as exc:
+            logger.info("Токен подписки отклонен без запроса в БД", extra={"token_prefix": token[:6], "reason": str(exc)})
+            raise SubscriptionUnavailable("Подписка недоступна или устарела") from exc
+
+    def _ensure_active(self, token: str, subscription: CachedSubscription | None) -> CachedSubscription:
+        now = datetime.now(timezone.utc)
         if not self._is_active_subscription(subscription, now):
             logger.warning(
                 "Подписка недоступна или истекла",
-                extra={"token_prefix": token[:6], "subscription_id": getattr(subscription, "id", None)},
+                extra={"token_prefix": token[:6], "subscription_id": getattr(subscription, "subscription_id", None)},
             )
             raise SubscriptionUnavailable("Подписка недоступна или устарела")
-        return subscription
+        return subscription  # type: ignore[return-value]
 
     @staticmethod
-    def _is_active_subscription(subscription: Subscription | None, now: datetime) -> bool:
+    def _is_active_subscription(subscription: CachedSubscription | None, now: datetime) -> bool:
         """Единственный критерий допуска к выдаче конфигурации."""
-        if not subscription or not subscription.user:
+        if not subscription:
             return False
-        if not subscription.user.is_active:
+        if not subscription.user_is_active:
             return False
         if subscription.is_expired(now):
             return False
@@ -58,36 +146,46 @@ class SubscriptionService:
             return False
         return True
 
-    async def _get_enabled_servers(self) -> List[Server]:
-        stmt = select(Server).where(Server.enabled.is_(True))
-        result = await self.session.execute(stmt)
-        raw_servers = list(result.scalars().all())
-        servers = [server for server in raw_servers if server.inbound_id is not None]
-        skipped = len(raw_servers) - len(servers)
-        if skipped:
-            logger.warning("Серверы без inbound_id пропущены из выдачи", extra={"skipped": skipped})
-        if not servers:
+    @staticmethod
+    def _ensure_servers(catalog: ServerCatalogSnapshot) -> ServerCatalogSnapshot:
+        if catalog.skipped:
+            logger.warning("Серверы без inbound_id пропущены из выдачи", extra={"skipped": catalog.skipped})
+        if catalog.error:
+            raise ValueError(catalog.error)
+        if not catalog.servers:
             logger.error("Нет активных серверов для генерации конфигурации")
             raise NoActiveServers("Нет активных серверов")
-        return servers
+        return catalog
+
+    async def get_subscription_payload(self, token: str, fmt: str | None = None) -> "SubscriptionPayload":
+        """Проверить токен и вернуть данные для выдачи.
+
+        С `fmt` и включенным Redis тело этого формата берется из Redis, а при
+        промахе рендерится сразу и записывается туда для остальных воркеров.
+        """
+        claims = self._verify_token_signature(token)
+        store_generation = self.subscription_store.generation
+        cached, catalog, lookup = await self._resolve(token, fmt)
+        if claims and cached and cached.user_id != claims.user_id:
+            cached = None
+        subscription = self._ensure_active(token, cached)
+        self._ensure_servers(catalog)
+        payload = SubscriptionPayload(subscription=subscription, catalog=catalog)
+        if fmt is None or lookup is None or not self.subscription_store.enabled:
+            return payload
+
+        if lookup.body is not None:
+            return replace(payload, stored=RenderedSubscription.for_format(lookup.body, fmt), stored_format=fmt)
+        rendered = payload.render(fmt)
+        await self.subscription_store.save(
+            token, subscription, store_generation, (catalog.fingerprint, fmt, rendered.body)
+        )
+        return replace(payload, stored=rendered, stored_format=fmt)
 
     async def build_subscription_payload(self, token: str) -> str:
         """Вернуть готовый текст подписки (plain text)."""
-        subscription = await self._get_active_subscription(token)
-        servers = await self._get_enabled_servers()
-        logger.info(
-            "Генерация payload подписки",
-            extra={
-                "subscription_id": subscription.id,
-                "user_id": subscription.user_id,
-                "servers_count": len(servers),
-            },
-        )
-        links = [
-            self.config_generator.build_vless_uri(server, str(subscription.user.uuid))
-            for server in servers
-        ]
-        return "\n".join(links)
+        payload = await self.get_subscription_payload(token)
+        return payload.render().body
 
     async def get_latest_subscription_for_user(self, user_id: int) -> Subscription | None:
         """Вернуть последнюю подписку пользователя (даже если истекла)."""
@@ -95,9 +193,10 @@ class SubscriptionService:
             select(Subscription)
             .where(Subscription.user_id == user_id)
             .order_by(Subscription.expires_at.desc())
+            .limit(1)
         )
         result = await self.session.execute(stmt)
-        sub = result.scalars().first()
+        sub = result.scalar_one_or_none()
         logger.info(
             "Получена последняя подписка пользователя",
             extra={"user_id": user_id, "subscription_id": getattr(sub, 'id', None)},
@@ -105,14 +204,13 @@ class SubscriptionService:
         return sub
 
     async def _get_enabled_servers_count(self) -> int:
-        stmt = select(func.count(Server.id)).where(Server.enabled.is_(True)).where(Server.inbound_id.is_not(None))
-        result = await self.session.execute(stmt)
-        return int(result.scalar_one() or 0)
+        catalog = await self.server_catalog.get(self.session)
+        return catalog.enabled_count
 
-    def _render_status(self, subscription: Subscription | None, now: datetime) -> str:
+    def _render_status(self, subscription: Subscription | None, now: datetime, user_is_active: bool = True) -> str:
         if not subscription:
             return "none"
-        if not subscription.user or not subscription.user.is_active:
+        if not user_is_active:
             return "blocked"
         if not subscription.is_active:
             return "blocked"
@@ -122,20 +220,21 @@ class SubscriptionService:
 
     async def get_subscription_summary_for_user(self, user: User | None) -> dict:
         """Каноничный ответ о подписке для Mini App/бота."""
+        if not user:
+            return await self.get_subscription_summary(None)
+        return await self.get_subscription_summary(user.id, user_is_active=user.is_active)
+
+    async def get_subscription_summary(self, user_id: int | None, user_is_active: bool = True) -> dict:
+        """То же по id пользователя, когда он уже известен (например, из сессии Mini App)."""
+        subscription = None
+        if user_id is not None:
+            subscription = await self.get_latest_subscription_for_user(user_id)
+        return await self._summarize(subscription, user_is_active)
+
+    async def _summarize(self, subscription: Subscription | None, user_is_active: bool) -> dict:
         servers_count = await self._get_enabled_servers_count()
         now = datetime.now(timezone.utc)
-        if not user:
-            return {
-                "status": "none",
-                "subscription_id": None,
-                "expires_at": None,
-                "expires_in_days": None,
-                "sub_url": None,
-                "servers_count": servers_count,
-            }
-
-        subscription = await self.get_latest_subscription_for_user(user.id)
-        status = self._render_status(subscription, now)
+        status = self._render_status(subscription, now, user_is_active)
 
         expires_in_days = None
         expires_at_iso = None
@@ -156,12 +255,21 @@ class SubscriptionService:
         }
 
     async def get_subscription_summary_by_tg_id(self, tg_id: int) -> dict:
-        """Каноничный ответ по Telegram ID (для бота)."""
+        """Каноничный ответ по Telegram ID (для бота): пользователь и последняя подписка одним запросом."""
+        latest = (
+            select(Subscription)
+            .where(Subscription.user_id == User.id)
+            .order_by(Subscription.expires_at.desc())
+            .limit(1)
+            .lateral()
+        )
+        latest_subscription = aliased(Subscription, latest)
         stmt = (
-            select(User)
+            select(User.is_active, latest_subscription)
+            .outerjoin(latest_subscription, true())
             .where(User.tg_id == tg_id)
-            .options(selectinload(User.subscriptions))
         )
-        result = await self.session.execute(stmt)
-        user = result.scalar_one_or_none()
-        return await self.get_subscription_summary_for_user(user)
+        row = (await self.session.execute(stmt)).first()
+        if row is None:
+            return await self._summarize(None, True)
+        return await self._summarize(row[1], row[0])
@@ -0,0 +1,153 @@
+"""Материализованные подписки в Redis, общие для всех воркеров и нод backend.
+
+Hash `sub:{token}`: поле `meta` — состояние подписки (JSON `CachedSubscription`),
+поля `{fingerprint}:{format}` — готовые тела ответа для каталога серверов с
+этим отпечатком. Смена набора серверов меняет отпечаток, и старые поля просто
+перестают читаться. Ключ живет до `expires_at` подписки (не дольше
+`SUB_STORE_MAX_TTL_SECONDS`) и удаляется по уведомлениям `subscription_changes`.
+Запись — write-through при промахе, поэтому Redis заполняется сам.
+
+Режим включается `SUBSCRIPTION_REDIS_URL`; любая ошибка Redis — это промах,
+и `/sub` идет в Postgres как раньше.
+"""
+import asyncio
+import json
+import logging
+import time
+from dataclasses import asdict
+from datetime import datetime
+
+from redis import asyncio as redis
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.services.token_cache import CachedSubscription
+
+logger = logging.getLogger(__name__)
+
+_META_FIELD = "meta"
+
+
+def _dump_meta(subscription: CachedSubscription) -> str:
+    data = asdict(subscription)
+    data["expires_at"] = subscription.expires_at.isoformat()
+    return json.dumps(data, separators=(",", ":"))
+
+
+def _load_meta(raw: bytes) -> CachedSubscription:
+    data = json.loads(raw)
+    data["expires_at"] = datetime.fromisoformat(data["expires_at"])
+    return CachedSubscription(**data)
+
+
+class SubscriptionStore:
+    def __init__(self, redis_url: str | None, max_ttl_seconds: int, key_prefix: str = "sub:") -> None:
+        self._redis = redis.from_url(redis_url) if redis_url else None
+        self.max_ttl_seconds = max_ttl_seconds
+        self.key_prefix = key_prefix
+        # как в token_cache: запись, прочитанная до инвалидации, не сохраняется
+        self.generation = 0
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self._redis is not None
+
+    def _key(self, token: str) -> str:
+        return f"{self.key_prefix}{token}"
+
+    def _user_key(self, user_id: int) -> str:
+        # в токенах нет двоеточий, пересечения с ключами подписок нет
+        return f"{self.key_prefix}user:{user_id}"
+
+    def _expire_at(self, subscription: CachedSubscription) -> int:
+        return min(int(subscription.expires_at.timestamp()), int(time.time()) + self.max_ttl_seconds)
+
+    async def fetch(
+        self, token: str, fingerprint: str, fmt: str
+    ) -> tuple[CachedSubscription | None, str | None]:
+        """Состояние подписки и готовое тело формата одним HMGET."""
+        if self._redis is None:
+            return None, None
+        try:
+            meta, body = await self._redis.hmget(self._key(token), _META_FIELD, f"{fingerprint}:{fmt}")
+        except RedisError as exc:
+            logger.warning("Redis недоступен, читаем подписку из Postgres", exc_info=exc)
+            return None, None
+        if meta is None:
+            return None, None
+        return _load_meta(meta), body.decode() if body is not None else None
+
+    async def save(
+        self,
+        token: str,
+        subscription: CachedSubscription,
+        generation: int,
+        rendered: tuple[str, str, str] | None = None,
+    ) -> None:
+        """Сохранить состояние и, если передано, тело `(fingerprint, format, body)`."""
+        if self._redis is None or generation != self.generation:
+            return
+        expire_at = self._expire_at(subscription)
+        if expire_at <= time.time():
+            return
+        mapping = {_META_FIELD: _dump_meta(subscription)}
+        if rendered is not None:
+            fingerprint, fmt, body = rendered
+            mapping[f"{fingerprint}:{fmt}"] = body
+        key = self._key(token)
+        user_key = self._user_key(subscription.user_id)
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            pipe.hset(key, mapping=mapping)
+            pipe.expireat(key, expire_at)
+            pipe.sadd(user_key, token)
+            pipe.expire(user_key, self.max_ttl_seconds)
+            await pipe.execute()
+        except RedisError as exc:
+            logger.warning("Не удалось материализовать подписку в Redis", exc_info=exc)
+
+    async def delete(self, tokens: list[str], user_ids: list[int]) -> None:
+        if self._redis is None:
+            return
+        try:
+            keys = [self._key(token) for token in tokens]
+            for user_id in user_ids:
+                user_key = self._user_key(user_id)
+                members = await self._redis.smembers(user_key)
+                keys.extend(self._key(member.decode()) for member in members)
+                keys.append(user_key)
+            if keys:
+                await self._redis.delete(*keys)
+        except RedisError as exc:
+            logger.warning("Не удалось удалить подписки из Redis", exc_info=exc)
+
+    def handle_notification(self, payload: str) -> None:
+        """Обработчик канала `subscription_changes` (формат см. в `change_notify`)."""
+        self.generation += 1
+        if self._redis is None:
+            return
+        tokens: list[str] = []
+        user_ids: list[int] = []
+        for item in payload.split(","):
+            kind, _, value = item.partition(":")
+            if kind == "token" and value:
+                tokens.append(value)
+            elif kind == "user" and value.isdigit():
+                user_ids.append(int(value))
+            # `*` приходит при каждом переподключении LISTEN; перебирать весь Redis
+            # ради него не будем, устаревание ограничено SUB_STORE_MAX_TTL_SECONDS
+        if tokens or user_ids:
+            task = asyncio.get_running_loop().create_task(self.delete(tokens, user_ids))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+
+
+subscription_store = SubscriptionStore(
+    redis_url=settings.subscription_redis_url,
+    max_ttl_seconds=settings.sub_store_max_ttl_seconds,
+)
@@ -0,0 +1,99 @@
+"""Кэш разрешения токенов подписки для `/sub/{token}`.
+
+Клиенты опрашивают подписку по таймеру, а сканеры перебирают случайные
+токены. Кэш держит результат поиска токена (в том числе отрицательный)
+в памяти воркера; записи сбрасываются уведомлениями Postgres из
+`change_notify`, TTL ограничивает устаревание при потере уведомлений.
+"""
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from app.config import settings
+from app.services.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CachedSubscription:
+    """Минимум данных подписки, нужный для выдачи конфигурации."""
+
+    subscription_id: int
+    user_id: int
+    user_uuid: str
+    expires_at: datetime
+    is_active: bool
+    user_is_active: bool
+
+    def is_expired(self, now: datetime) -> bool:
+        expires_at = self.expires_at
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        if now.tzinfo is None:
+            now = now.replace(tzinfo=timezone.utc)
+        return expires_at <= now
+
+
+class SubscriptionTokenCache:
+    def __init__(self, max_size: int, ttl_seconds: float, negative_ttl_seconds: float) -> None:
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._entries: TTLCache[str, CachedSubscription | None] = TTLCache(max_size, ttl_seconds)
+        # user_id -> токены в кэше; обращение к токену освежает и запись пользователя,
+        # поэтому индекс вытесняется не раньше самих токенов
+        self._user_tokens: TTLCache[int, set[str]] = TTLCache(max_size, ttl_seconds)
+        self.generation = 0
+
+    def lookup(self, token: str) -> tuple[bool, CachedSubscription | None]:
+        found, subscription = self._entries.lookup(token)
+        if subscription is not None:
+            self._user_tokens.lookup(subscription.user_id)
+        return found, subscription
+
+    def store(self, token: str, subscription: CachedSubscription | None, generation: int) -> None:
+        """Сохранить результат загрузки, если за время запроса не было инвалидаций."""
+        if generation != self.generation:
+            return
+        if subscription is None:
+            self._entries.set(token, None, ttl_seconds=self.negative_ttl_seconds)
+            return
+        self._entries.set(token, subscription)
+        tokens = self._user_tokens.get(subscription.user_id) or set()
+        tokens.add(token)
+        self._user_tokens.set(subscription.user_id, tokens)
+
+    def invalidate_token(self, token: str) -> None:
+        self.generation += 1
+        self._entries.pop(token)
+
+    def invalidate_user(self, user_id: int) -> None:
+        self.generation += 1
+        for token in self._user_tokens.get(user_id) or ():
+            self._entries.pop(token)
+        self._user_tokens.pop(user_id)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+        self._user_tokens.clear()
+
+    def handle_notification(self, payload: str) -> None:
+        """Применить payload канала `subscription_changes` (формат см. в `change_notify`)."""
+        for item in payload.split(","):
+            kind, _, value = item.partition(":")
+            if kind == "*":
+                self.clear()
+                return
+            if kind == "token" and value:
+                self.invalidate_token(value)
+            elif kind == "user" and value.isdigit():
+                self.invalidate_user(int(value))
+            elif item:
+                logger.warning("Неизвестный элемент уведомления о подписках", extra={"item": item[:64]})
+
+
+token_cache = SubscriptionTokenCache(
+    max_size=settings.token_cache_max_size,
+    ttl_seconds=settings.token_cache_ttl_seconds,
+    negative_ttl_seconds=settings.token_cache_negative_ttl_seconds,
+)
@@ -1,8 +1,20 @@
 """Генерация безопасных токенов для подписок."""
 import secrets
 
+from app.services.token_signing import subscription_token_signer
+
 
 def generate_subscription_token(length: int = 32) -> str:
     """Создать URL-safe токен достаточной длины."""
     entropy_bytes = max(16, length)
     return secrets.token_urlsafe(entropy_bytes)
+
+
+def issue_subscription_token(user_id: int) -> str:
+    """Токен для новой подписки: подписанный, если настроены ключи, иначе случайный.
+
+    Потолок срока не вшивается: подписки продлеваются без смены токена.
+    """
+    if subscription_token_signer.enabled:
+        return subscription_token_signer.issue(user_id)
+    return generate_subscription_token()
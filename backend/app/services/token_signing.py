@@ -0,0 +1,115 @@
+"""Подписанные токены подписки: проверка без обращения к БД.
+
+Формат: `<key_id>.<payload>.<mac>` (base64url без padding), где payload —
+user_id, потолок срока действия (unix time, 0 — без потолка) и случайный
+nonce, а mac — усеченный HMAC-SHA256 по `key_id` и payload. Старые
+непрозрачные токены из `secrets.token_urlsafe` не содержат точек и
+по-прежнему проверяются через БД, если не включен `SUBSCRIPTION_TOKEN_REQUIRE_SIGNED`.
+
+Ротация ключей: новые токены подписываются активным ключом, проверка
+принимает любой ключ из `SUBSCRIPTION_TOKEN_KEYS`, пока его не удалят.
+"""
+import base64
+import hashlib
+import hmac
+import re
+import secrets
+import struct
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+from app.config import settings
+
+_PAYLOAD = struct.Struct(">QQ8s")
+_MAC_BYTES = 16
+_KEY_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,16}$")
+_OPAQUE_TOKEN_RE = re.compile(r"^[A-Za-z0-9_-]{16,255}$")
+
+
+class InvalidSubscriptionToken(Exception):
+    """Токен заведомо невалиден: битый формат, чужая подпись или истек потолок срока."""
+
+
+@dataclass(frozen=True)
+class TokenClaims:
+    key_id: str
+    user_id: int
+    not_after: int  # 0 — срок определяется только подпиской в БД
+
+
+def b64url_encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def b64url_decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def parse_signing_keys(raw: str) -> dict[str, bytes]:
+    """`kid1:secret1,kid2:secret2` -> {kid: secret}."""
+    keys: dict[str, bytes] = {}
+    for part in raw.split(","):
+        key_id, sep, secret = part.strip().partition(":")
+        if not part.strip():
+            continue
+        if not sep or not secret or not _KEY_ID_RE.match(key_id):
+            raise ValueError(f"Некорректный ключ подписи токенов: {key_id or part[:8]}")
+        keys[key_id] = secret.encode()
+    return keys
+
+
+class SubscriptionTokenSigner:
+    def __init__(self, keys: dict[str, bytes], active_key_id: str | None, require_signed: bool = False) -> None:
+        if active_key_id and active_key_id not in keys:
+            raise ValueError("Активный ключ подписи токенов отсутствует в списке ключей")
+        self.keys = keys
+        self.active_key_id = active_key_id
+        self.require_signed = require_signed
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.active_key_id)
+
+    def _mac(self, key_id: str, payload: bytes) -> bytes:
+        message = key_id.encode() + b"." + payload
+        return hmac.new(self.keys[key_id], message, hashlib.sha256).digest()[:_MAC_BYTES]
+
+    def issue(self, user_id: int, not_after: datetime | None = None) -> str:
+        if not self.active_key_id:
+            raise RuntimeError("Подпись токенов не настроена")
+        deadline = int(not_after.timestamp()) if not_after else 0
+        payload = _PAYLOAD.pack(user_id, deadline, secrets.token_bytes(8))
+        mac = self._mac(self.active_key_id, payload)
+        return f"{self.active_key_id}.{b64url_encode(payload)}.{b64url_encode(mac)}"
+
+    def verify(self, token: str) -> TokenClaims | None:
+        """Claims подписанного токена, `None` для допустимого старого токена, иначе исключение."""
+        if "." not in token:
+            if self.require_signed or not _OPAQUE_TOKEN_RE.match(token):
+                raise InvalidSubscriptionToken("Токен не подписан")
+            return None
+
+        parts = token.split(".")
+        if len(parts) != 3 or parts[0] not in self.keys:
+            raise InvalidSubscriptionToken("Неизвестный формат или ключ токена")
+        key_id, payload_b64, mac_b64 = parts
+        try:
+            payload = b64url_decode(payload_b64)
+            mac = b64url_decode(mac_b64)
+        except ValueError as exc:
+            raise InvalidSubscriptionToken("Токен не декодируется") from exc
+        if len(payload) != _PAYLOAD.size or not hmac.compare_digest(mac, self._mac(key_id, payload)):
+            raise InvalidSubscriptionToken("Подпись токена не совпадает")
+
+        user_id, not_after, _nonce = _PAYLOAD.unpack(payload)
+        if not_after and not_after <= time.time():
+            raise InvalidSubscriptionToken("Срок действия токена истек")
+        return TokenClaims(key_id=key_id, user_id=user_id, not_after=not_after)
+
+
+subscription_token_signer = SubscriptionTokenSigner(
+    keys=parse_signing_keys(settings.subscription_token_keys),
+    active_key_id=settings.subscription_token_active_key_id,
+    require_signed=settings.subscription_token_require_signed,
+)
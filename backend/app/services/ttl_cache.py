@@ -0,0 +1,81 @@
+"""Ограниченный по размеру LRU-кэш с временем жизни записей."""
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class TTLCache(Generic[K, V]):
+    """Кэш процесса: вытесняет самые старые по обращению записи и забывает просроченные.
+
+    С `max_weight` и `weigh` размер ограничен еще и суммарным весом значений
+    (например, байтами тел ответов).
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl_seconds: float,
+        max_weight: int | None = None,
+        weigh: Callable[[V], int] | None = None,
+    ) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.max_weight = max_weight
+        self._weigh = weigh
+        self.weight = 0
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def _value_weight(self, value: V) -> int:
+        return self._weigh(value) if self._weigh else 0
+
+    def _remove(self, key: K) -> None:
+        item = self._data.pop(key, _MISSING)
+        if item is not _MISSING:
+            self.weight -= self._value_weight(item[1])  # type: ignore[index]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def lookup(self, key: K) -> tuple[bool, V | None]:
+        """Вернуть (найдено, значение); `None` тоже может быть закэшированным значением."""
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            return False, None
+        deadline, value = item  # type: ignore[misc]
+        if deadline <= time.monotonic():
+            self._remove(key)
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def get(self, key: K) -> V | None:
+        return self.lookup(key)[1]
+
+    def set(self, key: K, value: V, ttl_seconds: float | None = None) -> None:
+        if self.max_size <= 0:
+            return
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl <= 0:
+            return
+        weight = self._value_weight(value)
+        if self.max_weight is not None and weight > self.max_weight:
+            self._remove(key)
+            return
+        self._remove(key)
+        self._data[key] = (time.monotonic() + ttl, value)
+        self.weight += weight
+        while len(self._data) > self.max_size or (self.max_weight is not None and self.weight > self.max_weight):
+            self._remove(next(iter(self._data)))
+
+    def pop(self, key: K) -> None:
+        self._remove(key)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.weight = 0
@@ -0,0 +1,74 @@
+"""Get-or-create пользователя по tg_id без гонки уникального индекса.
+
+Обычный путь — один SELECT по tg_id без записи. Если пользователя нет или
+его нужно повысить до admin из `ADMIN_TG_IDS`, выполняется один
+`INSERT ... ON CONFLICT (tg_id) ... RETURNING`: он создает строку сразу с
+нужной ролью (а для admin при конфликте повышает существующую) и
+возвращает ее как объект ORM-модели вызывающего. Повторный SELECT нужен
+только при проигранной гонке: при двойном /start второй INSERT дождется
+первого и ничего не вернет. Backend, бот и `services/pg_repo` держат свои
+классы `User` на одну таблицу. Функция ничего не коммитит и не
+откатывает: зафиксировать запись — дело вызывающего. Модуль не читает
+`app.config`, поэтому его импортирует и бот.
+"""
+import logging
+import uuid as uuid_module
+from collections.abc import Collection
+from typing import Any
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+
+def _upsert_statement(user_model: type[Any], tg_id: int, is_admin: bool):
+    stmt = insert(user_model).values(
+        tg_id=tg_id,
+        uuid=uuid_module.uuid4(),
+        is_active=True,
+        role="admin" if is_admin else "user",
+    )
+    if is_admin:
+        # DO UPDATE только при реальном повышении, иначе строку не трогаем
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["tg_id"],
+            set_={"role": "admin"},
+            where=user_model.role != "admin",
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=["tg_id"])
+    return (
+        select(user_model)
+        .from_statement(stmt.returning(user_model))
+        .execution_options(populate_existing=True)
+    )
+
+
+async def get_or_create_user(
+    session: AsyncSession,
+    user_model: type[Any],
+    tg_id: int,
+    admin_tg_ids: Collection[int] = (),
+) -> tuple[Any, bool]:
+    """Вернуть (пользователь, нужен ли commit).
+
+    Флаг `True`, если строку создали или повысили роль в транзакции вызывающего.
+    """
+    lookup = select(user_model).where(user_model.tg_id == tg_id)
+    is_admin = tg_id in admin_tg_ids
+    user = (await session.execute(lookup)).scalar_one_or_none()
+    if user is not None and (not is_admin or user.role == "admin"):
+        return user, False
+
+    written = (await session.execute(_upsert_statement(user_model, tg_id, is_admin))).scalar_one_or_none()
+    if written is None:
+        # строку вставил конкурентный запрос (с той же ролью); берем ее
+        lookup = lookup.execution_options(populate_existing=True)
+        return (await session.execute(lookup)).scalar_one(), False
+    logger.info(
+        "Пользователь создан" if user is None else "Пользователь повышен до admin",
+        extra={"tg_id": tg_id, "user_id": written.id, "role": written.role},
+    )
+    return written, True
@@ -1,9 +1,26 @@
-"""Клиент для работы с 3X-UI на основе локальной реализации (сессии и API панели)."""
+"""Клиент для работы с 3X-UI на основе локальной реализации (сессии и API панели).
+
+Процесс держит один общий клиент `xui_client`: пул соединений к панели и
+cookie авторизации живут, пока панель не отклонит cookie. Повторный вход
+сериализован: параллельные запросы с протухшей cookie ждут один `/login`.
+Закрывается при остановке процесса (`await xui_client.close()`).
+
+Клиенты inbound'ов клиент держит в снимке с индексом по id/email: снимок
+всех inbound'ов обновляется одним `list_inbounds` раз в
+`XUI_INBOUND_CACHE_TTL_SECONDS` и правится на месте после удачных изменений,
+поэтому операция над пользователем не скачивает и не разбирает весь список
+клиентов inbound'а. Если клиента нет в снимке, перечитывается только этот
+inbound (`get_inbound`) и не чаще раза в `INBOUND_RECHECK_SECONDS`: промах в
+только что прочитанном снимке значит, что клиента в inbound'е нет.
+"""
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
+import time
 from copy import deepcopy
+from dataclasses import dataclass, field
 from typing import Any, Iterable
 
 import aiohttp
@@ -13,6 +30,57 @@ from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# промах в снимке inbound'а моложе этого не перепроверяется в панели
+INBOUND_RECHECK_SECONDS = 5.0
+
+
+def _extract_clients(inbound: dict[str, Any]) -> list[dict[str, Any]]:
+    try:
+        inbound_settings = json.loads(inbound.get("settings") or "{}")
+    except json.JSONDecodeError:
+        return []
+    clients = inbound_settings.get("clients") or []
+    return clients if isinstance(clients, list) else []
+
+
+@dataclass
+class InboundSnapshot:
+    """Клиенты одного inbound'а: индекс по id и email, первый клиент — шаблон для новых."""
+
+    inbound_id: int
+    template: dict[str, Any] = field(default_factory=dict)
+    clients: dict[str, dict[str, Any]] = field(default_factory=dict)
+    # 0 — снимок устарел (изменение в панели не удалось), перечитать перед использованием
+    loaded_at: float = field(default_factory=time.monotonic)
+
+    @classmethod
+    def from_inbound(cls, inbound_id: int, inbound: dict[str, Any]) -> "InboundSnapshot":
+        snapshot = cls(inbound_id)
+        for client in _extract_clients(inbound):
+            if not snapshot.template:
+                snapshot.template = client
+            snapshot.put(client)
+        return snapshot
+
+    def find(self, client_uuid: str) -> tuple[dict[str, Any] | None, str | None]:
+        client = self.clients.get(str(client_uuid))
+        if client is None:
+            return None, None
+        return client, str(client.get("id") or client.get("email") or "") or None
+
+    def put(self, client: dict[str, Any]) -> None:
+        for key in (client.get("id"), client.get("email")):
+            if key:
+                self.clients[str(key)] = client
+
+    def drop(self, client: dict[str, Any]) -> None:
+        for key in (client.get("id"), client.get("email")):
+            if key:
+                self.clients.pop(str(key), None)
+
+    def mark_stale(self) -> None:
+        self.loaded_at = 0.0
+
 
 class XUIClient:
     """Адаптер к 3X-UI API (куки-сессия + /panel/api/*)."""
@@ -21,7 +89,14 @@ class XUIClient:
         self.cookie_jar = aiohttp.CookieJar(unsafe=True)
         self.session: ClientSession | None = None
         self._logged_in = False
+        # растет при каждом удачном входе: по нему видно, что cookie уже обновил другой запрос
+        self._login_generation = 0
+        self._login_lock = asyncio.Lock()
         self._base_url = settings.xui_base_url.rstrip("/")
+        self.inbound_cache_ttl = settings.xui_inbound_cache_ttl_seconds
+        self._inbounds: dict[int, InboundSnapshot] = {}
+        self._inbounds_loaded_at = 0.0
+        self._inbounds_lock = asyncio.Lock()
 
     def _build_url(self, path: str) -> str:
         if not path.startswith("/"):
@@ -32,6 +107,7 @@ class XUIClient:
         if self.session is None or self.session.closed:
             timeout = ClientTimeout(total=settings.xui_request_timeout or None)
             self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=settings.xui_pool_size),
                 cookie_jar=self.cookie_jar,
                 trust_env=True,
                 timeout=timeout,
@@ -41,6 +117,15 @@ class XUIClient:
     async def close(self) -> None:
         if self.session:
             await self.session.close()
+        self.session = None
+        self._logged_in = False
+
+    async def _ensure_login(self, failed_generation: int | None = None) -> bool:
+        """Войти, если cookie нет или ее отклонили; одновременно выполняется один `/login`."""
+        async with self._login_lock:
+            if self._logged_in and self._login_generation != failed_generation:
+                return True
+            return await self._login()
 
     async def _login(self) -> bool:
         await self._ensure_session()
@@ -59,6 +144,7 @@ class XUIClient:
                     success = "success" in raw.lower()
             if success:
                 self._logged_in = True
+                self._login_generation += 1
                 logger.info("Аутентификация в 3X-UI успешна")
                 return True
             logger.error(
@@ -79,8 +165,9 @@ class XUIClient:
         assert self.session is not None
 
         if not self._logged_in:
-            if not await self._login():
+            if not await self._ensure_login():
                 return 0, None, ""
+        generation = self._login_generation
 
         url = self._build_url(path)
         async with self.session.request(method, url, **kwargs) as resp:
@@ -92,29 +179,59 @@ class XUIClient:
 
             if resp.status in {401, 403, 404} and not retry:
                 # Панель возвращает 404 для неавторизованных API-запросов
-                self._logged_in = False
-                if await self._login():
-                    return await self._request_json(method, path, retry=True, **kwargs)
-            return resp.status, data, raw
-
-    @staticmethod
-    def _extract_clients(inbound: dict[str, Any]) -> list[dict[str, Any]]:
-        try:
-            inbound_settings = json.loads(inbound.get("settings") or "{}")
-        except json.JSONDecodeError:
-            return []
-        clients = inbound_settings.get("clients") or []
-        return clients if isinstance(clients, list) else []
-
-    @staticmethod
-    def _find_client(clients: list[dict[str, Any]], client_uuid: str) -> tuple[dict[str, Any] | None, str | None]:
-        target = str(client_uuid)
-        for client in clients:
-            cid = str(client.get("id", ""))
-            email = str(client.get("email", ""))
-            if cid == target or email == target:
-                return client, cid or email or None
-        return None, None
+                relogged = await self._ensure_login(failed_generation=generation)
+            else:
+                return resp.status, data, raw
+        if relogged:
+            return await self._request_json(method, path, retry=True, **kwargs)
+        return resp.status, data, raw
+
+    def _inbounds_fresh(self) -> bool:
+        return time.monotonic() - self._inbounds_loaded_at < self.inbound_cache_ttl
+
+    async def _refresh_inbounds(self, stale_since: float) -> None:
+        async with self._inbounds_lock:
+            # пока ждали блокировку, снимок мог обновить другой запрос
+            if self._inbounds_loaded_at > stale_since:
+                return
+            inbounds = await self.list_inbounds()
+            if not inbounds:
+                return
+            self._inbounds = {
+                int(inbound["id"]): InboundSnapshot.from_inbound(int(inbound["id"]), inbound)
+                for inbound in inbounds
+                if inbound.get("id") is not None
+            }
+            self._inbounds_loaded_at = time.monotonic()
+
+    async def _reload_inbound(self, snapshot: InboundSnapshot) -> InboundSnapshot:
+        """Перечитать один inbound, если его снимок старше `INBOUND_RECHECK_SECONDS`."""
+        async with self._inbounds_lock:
+            # параллельные промахи по тому же inbound'у дождутся одного запроса
+            current = self._inbounds.get(snapshot.inbound_id, snapshot)
+            if time.monotonic() - current.loaded_at < INBOUND_RECHECK_SECONDS:
+                return current
+            inbound = await self.get_inbound(snapshot.inbound_id)
+            if not inbound:
+                return current
+            fresh = InboundSnapshot.from_inbound(snapshot.inbound_id, inbound)
+            if self.inbound_cache_ttl > 0:
+                self._inbounds[snapshot.inbound_id] = fresh
+            return fresh
+
+    async def _snapshot(self, inbound_id: int) -> InboundSnapshot | None:
+        """Снимок клиентов inbound'а; при выключенном кэше — свежий `get_inbound`."""
+        if self.inbound_cache_ttl <= 0:
+            inbound = await self.get_inbound(inbound_id)
+            return InboundSnapshot.from_inbound(inbound_id, inbound) if inbound else None
+        if not self._inbounds_fresh():
+            await self._refresh_inbounds(self._inbounds_loaded_at)
+        snapshot = self._inbounds.get(inbound_id)
+        if snapshot is None:
+            logger.error("Inbound не найден в 3X-UI", extra={"inbound_id": inbound_id})
+        elif not snapshot.loaded_at:
+            snapshot = await self._reload_inbound(snapshot)
+        return snapshot
 
     def _build_client_payload(self, template: dict[str, Any], client_id: str) -> dict[str, Any]:
         base = deepcopy(template) if template else {}
@@ -160,12 +277,11 @@ class XUIClient:
 
     async def add_client(self, client_uuid: str, inbound_id: int) -> bool:
         """Добавить клиента через /panel/api/inbounds/addClient."""
-        inbound = await self.get_inbound(inbound_id)
-        if not inbound:
+        snapshot = await self._snapshot(inbound_id)
+        if not snapshot:
             return False
 
-        clients = self._extract_clients(inbound)
-        existing, _ = self._find_client(clients, client_uuid)
+        existing, _ = snapshot.find(client_uuid)
         if existing:
             logger.info(
                 "Клиент уже существует в inbound, пропускаем добавление",
@@ -173,8 +289,7 @@ class XUIClient:
             )
             return True
 
-        template = clients[0] if clients else {}
-        new_client = self._build_client_payload(template, str(client_uuid))
+        new_client = self._build_client_payload(snapshot.template, str(client_uuid))
         payload = {
             "id": inbound_id,
             "settings": json.dumps({"clients": [new_client]}),
@@ -186,31 +301,51 @@ class XUIClient:
             json=payload,
         )
         if status != 200 or not data or not data.get("success"):
+            # снимок мог устареть: клиента уже добавил другой процесс
+            snapshot.mark_stale()
+            if (await self._reload_inbound(snapshot)).find(client_uuid)[0]:
+                return True
             logger.error(
                 "Не удалось добавить клиента в inbound",
                 extra={"status": status, "body": text[:200], "inbound_id": inbound_id, "client_id": client_uuid},
             )
             return False
+        snapshot.put(new_client)
         return True
 
+    async def _find_existing(
+        self,
+        client_uuid: str,
+        inbound_id: int,
+    ) -> tuple[InboundSnapshot | None, dict[str, Any] | None, str | None]:
+        """Найти клиента в снимке; при промахе в несвежем снимке перечитать только этот inbound."""
+        snapshot = await self._snapshot(inbound_id)
+        if not snapshot:
+            return None, None, None
+        existing, client_id = snapshot.find(client_uuid)
+        if existing is None and self.inbound_cache_ttl > 0:
+            snapshot = await self._reload_inbound(snapshot)
+            existing, client_id = snapshot.find(client_uuid)
+        return snapshot, existing, client_id
+
     async def disable_client(self, client_uuid: str, inbound_id: int) -> bool:
         """Отключить клиента через /panel/api/inbounds/updateClient/{clientId}."""
-        inbound = await self.get_inbound(inbound_id)
-        if not inbound:
+        snapshot, existing, client_id = await self._find_existing(client_uuid, inbound_id)
+        if not snapshot:
             return False
-
-        clients = self._extract_clients(inbound)
-        existing, client_id = self._find_client(clients, client_uuid)
         if not existing or not client_id:
             logger.warning(
                 "Клиент не найден или уже выключен",
                 extra={"inbound_id": inbound_id, "client_id": client_uuid},
             )
             return False
+        if existing.get("enable") is False:
+            return True
 
+        disabled = dict(existing, enable=False)
         payload = {
             "id": inbound_id,
-            "settings": json.dumps({"clients": [dict(existing, enable=False)]}),
+            "settings": json.dumps({"clients": [disabled]}),
         }
         status, data, text = await self._request_json(
             "POST",
@@ -218,21 +353,20 @@ class XUIClient:
             json=payload,
         )
         if status != 200 or not data or not data.get("success"):
+            snapshot.mark_stale()
             logger.error(
                 "Не удалось выключить клиента в 3X-UI",
                 extra={"status": status, "body": text[:200], "inbound_id": inbound_id, "client_id": client_uuid},
             )
             return False
+        snapshot.put(disabled)
         return True
 
     async def remove_client(self, client_uuid: str, inbound_id: int) -> bool:
         """Удалить клиента через /panel/api/inbounds/:id/delClientByEmail/:email."""
-        inbound = await self.get_inbound(inbound_id)
-        if not inbound:
+        snapshot, existing, _ = await self._find_existing(client_uuid, inbound_id)
+        if not snapshot:
             return False
-
-        clients = self._extract_clients(inbound)
-        existing, _ = self._find_client(clients, client_uuid)
         email = str(existing.get("email")) if existing else str(client_uuid)
 
         status, data, text = await self._request_json(
@@ -240,14 +374,21 @@ class XUIClient:
             f"/panel/api/inbounds/{inbound_id}/delClientByEmail/{email}",
         )
         if status != 200 or not data or not data.get("success"):
+            snapshot.mark_stale()
             logger.error(
                 "Не удалось удалить клиента в 3X-UI",
                 extra={"status": status, "body": text[:200], "inbound_id": inbound_id, "client_id": client_uuid},
             )
             return False
+        if existing:
+            snapshot.drop(existing)
         return True
 
 
+# общий клиент процесса (backend, бот через pg_repo, `python -m app.jobs`)
+xui_client = XUIClient()
+
+
 async def add_clients_for_inbounds(client: XUIClient, client_uuid: str, inbound_ids: Iterable[int]) -> None:
     """Добавить клиента во все перечисленные inbound'ы, продолжая при ошибке."""
     for inbound_id in inbound_ids:
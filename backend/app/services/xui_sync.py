@@ -3,43 +3,38 @@ from __future__ import annotations
 
 import logging
 
-from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models import Server
+from app.services.server_catalog import server_catalog
 from app.services.xui_client import (
     XUIClient,
     add_clients_for_inbounds,
     disable_clients_for_inbounds,
     remove_clients_for_inbounds,
+    xui_client as shared_xui_client,
 )
 
 logger = logging.getLogger(__name__)
 
 
 async def _collect_inbound_ids(session: AsyncSession, *, enabled_only: bool = True) -> list[int]:
-    stmt = select(Server.inbound_id).where(Server.inbound_id.is_not(None))
-    if enabled_only:
-        stmt = stmt.where(Server.enabled.is_(True))
-
     try:
-        result = await session.execute(stmt)
+        catalog = await server_catalog.get(session)
     except SQLAlchemyError as exc:
         logger.error("Не удалось получить inbound_id из БД", exc_info=exc)
         return []
 
-    inbound_ids = [inbound_id for inbound_id in result.scalars().all() if inbound_id is not None]
-    unique_ids = list(dict.fromkeys(inbound_ids))  # сохраняем порядок без дублей
+    # каталог уже хранит inbound_id в порядке серверов без дублей
+    unique_ids = list(catalog.inbound_ids if enabled_only else catalog.all_inbound_ids)
     if not unique_ids:
         logger.warning("Нет inbound_id для синхронизации с 3X-UI")
     return unique_ids
 
 
-def _with_client(provided: XUIClient | None) -> tuple[XUIClient, bool]:
-    if provided:
-        return provided, False
-    return XUIClient(), True
+def _with_client(provided: XUIClient | None) -> XUIClient:
+    # общий клиент не закрываем: его сессия и cookie нужны следующим вызовам
+    return provided or shared_xui_client
 
 
 async def ensure_user_enabled(
@@ -53,12 +48,7 @@ async def ensure_user_enabled(
     if not inbound_ids:
         return
 
-    client, should_close = _with_client(xui_client)
-    try:
-        await add_clients_for_inbounds(client, user_uuid, inbound_ids)
-    finally:
-        if should_close:
-            await client.close()
+    await add_clients_for_inbounds(_with_client(xui_client), user_uuid, inbound_ids)
 
 
 async def ensure_user_disabled(
@@ -73,12 +63,7 @@ async def ensure_user_disabled(
     if not inbound_ids:
         return
 
-    client, should_close = _with_client(xui_client)
-    try:
-        await disable_clients_for_inbounds(client, user_uuid, inbound_ids)
-    finally:
-        if should_close:
-            await client.close()
+    await disable_clients_for_inbounds(_with_client(xui_client), user_uuid, inbound_ids)
 
 
 async def remove_user_from_inbounds(
@@ -93,9 +78,4 @@ async def remove_user_from_inbounds(
     if not inbound_ids:
         return
 
-    client, should_close = _with_client(xui_client)
-    try:
-        await remove_clients_for_inbounds(client, user_uuid, inbound_ids)
-    finally:
-        if should_close:
-            await client.close()
+    await remove_clients_for_inbounds(_with_client(xui_client), user_uuid, inbound_ids)
@@ -2,9 +2,11 @@
 const webApp = window.Telegram?.WebApp;
 const apiBase = window.location.origin;
 const INITDATA_STORAGE_KEY = "tg_initData";
+const SESSION_STORAGE_KEY = "tg_session";
 
 const state = {
   initData: "",
+  sessionToken: sessionStorage.getItem(SESSION_STORAGE_KEY) || "",
   servers: [],
   editingId: null,
 };
@@ -32,6 +34,17 @@ function notify(message) {
   webApp?.showPopup?.({ title: "Успех", message });
 }
 
+function rememberSession(token) {
+  if (!token) return;
+  state.sessionToken = token;
+  sessionStorage.setItem(SESSION_STORAGE_KEY, token);
+}
+
+function forgetSession() {
+  state.sessionToken = "";
+  sessionStorage.removeItem(SESSION_STORAGE_KEY);
+}
+
 async function apiAuth() {
   const res = await fetch(`${apiBase}/api/auth/telegram`, {
     method: "POST",
@@ -41,13 +54,31 @@ async function apiAuth() {
   if (!res.ok) {
     throw new Error("Ошибка аутентификации");
   }
-  return res.json();
+  const data = await res.json();
+  rememberSession(data.session_token);
+  return data;
+}
+
+// Запрос с сессионным токеном; при 401 один раз переавторизуемся по initData
+async function authorizedFetch(url, options = {}, retry = true) {
+  const headers = { ...(options.headers || {}) };
+  if (state.sessionToken) {
+    headers.Authorization = `Bearer ${state.sessionToken}`;
+  } else {
+    headers["X-Telegram-Init-Data"] = state.initData;
+  }
+  const res = await fetch(url, { ...options, headers });
+  rememberSession(res.headers.get("X-Session-Token"));
+  if (res.status === 401 && retry && state.sessionToken) {
+    forgetSession();
+    await apiAuth();
+    return authorizedFetch(url, options, false);
+  }
+  return res;
 }
 
 async function apiGetServers() {
-  const res = await fetch(`${apiBase}/api/admin/servers`, {
-    headers: { "X-Telegram-Init-Data": state.initData },
-  });
+  const res = await authorizedFetch(`${apiBase}/api/admin/servers`);
   if (!res.ok) {
     throw new Error("Не удалось загрузить сервера");
   }
@@ -55,12 +86,9 @@ async function apiGetServers() {
 }
 
 async function apiCreateServer(payload) {
-  const res = await fetch(`${apiBase}/api/admin/servers`, {
+  const res = await authorizedFetch(`${apiBase}/api/admin/servers`, {
     method: "POST",
-    headers: {
-      "Content-Type": "application/json",
-      "X-Telegram-Init-Data": state.initData,
-    },
+    headers: { "Content-Type": "application/json" },
     body: JSON.stringify(payload),
   });
   if (!res.ok) {
@@ -71,12 +99,9 @@ async function apiCreateServer(payload) {
 }
 
 async function apiUpdateServer(id, payload) {
-  const res = await fetch(`${apiBase}/api/admin/servers/${id}`, {
+  const res = await authorizedFetch(`${apiBase}/api/admin/servers/${id}`, {
     method: "PUT",
-    headers: {
-      "Content-Type": "application/json",
-      "X-Telegram-Init-Data": state.initData,
-    },
+    headers: { "Content-Type": "application/json" },
     body: JSON.stringify(payload),
   });
   if (!res.ok) {
@@ -87,12 +112,9 @@ async function apiUpdateServer(id, payload) {
 }
 
 async function apiPatchServer(id, payload) {
-  const res = await fetch(`${apiBase}/api/admin/servers/${id}`, {
+  const res = await authorizedFetch(`${apiBase}/api/admin/servers/${id}`, {
     method: "PATCH",
-    headers: {
-      "Content-Type": "application/json",
-      "X-Telegram-Init-Data": state.initData,
-    },
+    headers: { "Content-Type": "application/json" },
     body: JSON.stringify(payload),
   });
   if (!res.ok) {
@@ -103,9 +125,8 @@ async function apiPatchServer(id, payload) {
 }
 
 async function apiDeleteServer(id) {
-  const res = await fetch(`${apiBase}/api/admin/servers/${id}`, {
+  const res = await authorizedFetch(`${apiBase}/api/admin/servers/${id}`, {
     method: "DELETE",
-    headers: { "X-Telegram-Init-Data": state.initData },
   });
   if (!res.ok) {
     const text = await res.text();
@@ -14,6 +14,7 @@ class Settings:
     database_url: str
     base_sub_url: str
     webapp_url: str
+    admin_tg_ids: tuple[int, ...] = ()
 
 
 def get_settings() -> Settings:
@@ -27,12 +28,15 @@ def get_settings() -> Settings:
 
     base_sub_url = os.getenv("BASE_SUB_URL", "https://stabelspace.ru/sub")
     webapp_url = os.getenv("WEBAPP_URL", "https://stabelspace.ru/app")
+    # тот же список, что и у backend: роль admin выставляется при первом контакте
+    admin_tg_ids = tuple(int(part) for part in os.getenv("ADMIN_TG_IDS", "").split(",") if part.strip())
 
     return Settings(
         bot_token=bot_token,
         database_url=database_url,
         base_sub_url=base_sub_url.rstrip("/"),
         webapp_url=webapp_url,
+        admin_tg_ids=admin_tg_ids,
     )
 
 
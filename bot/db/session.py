@@ -1,13 +1,34 @@
 """Инициализация асинхронной сессии SQLAlchemy для работы с одной БД с backend."""
+import logging
+import sys
+from pathlib import Path
+
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
 
 from bot.config import settings
 
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+BACKEND_DIR = BASE_DIR / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.append(str(BACKEND_DIR))
+
+try:
+    from app.services.db_pool import PoolOptions, create_pooled_engine
+except Exception:
+    PoolOptions = create_pooled_engine = None  # type: ignore
+    logger.warning("Настройки пула backend недоступны, используем параметры SQLAlchemy по умолчанию")
+
 
 class Base(DeclarativeBase):
     """Базовый класс декларативных моделей."""
 
 
-engine = create_async_engine(settings.database_url, future=True)
+if create_pooled_engine:
+    # те же DB_POOL_* переменные, что и у backend
+    engine = create_pooled_engine(settings.database_url, PoolOptions.from_env(), future=True)
+else:
+    engine = create_async_engine(settings.database_url, future=True)
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
@@ -9,6 +9,7 @@ from aiogram.enums import ParseMode
 from bot.config import settings
 from bot.handlers import start as start_handlers
 from bot.handlers import subscription as subscription_handlers
+from bot.services.subscription_service import close_xui_client
 
 logger = logging.getLogger(__name__)
 
@@ -41,7 +42,10 @@ async def main() -> None:
     dp.include_router(start_handlers.router)
     dp.include_router(subscription_handlers.router)
 
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await close_xui_client()
 
 
 if __name__ == "__main__":
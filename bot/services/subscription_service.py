@@ -22,11 +22,24 @@ if str(BACKEND_DIR) not in sys.path:
     sys.path.append(str(BACKEND_DIR))
 
 try:
+    from app.services.xui_client import xui_client
     from app.services.xui_sync import ensure_user_enabled
 except Exception:
-    ensure_user_enabled = None  # type: ignore
+    ensure_user_enabled = xui_client = None  # type: ignore
     logger.warning("Интеграция с 3X-UI недоступна, клиенты не будут синхронизированы")
 
+try:
+    from app.services.change_notify import notify_subscription_changes
+except Exception:
+    notify_subscription_changes = None  # type: ignore
+    logger.warning("Уведомления backend недоступны, кэш токенов сбросится только по TTL")
+
+try:
+    from app.services.token_generator import issue_subscription_token
+except Exception:
+    issue_subscription_token = None  # type: ignore
+    logger.warning("Подпись токенов backend недоступна, выпускаем случайные токены")
+
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
@@ -47,6 +60,7 @@ class SubscriptionService:
             select(Subscription)
             .where(Subscription.user_id == user_id)
             .order_by(Subscription.expires_at.desc())
+            .limit(1)
         )
         result = await self.session.execute(stmt)
         sub = result.scalars().first()
@@ -72,7 +86,7 @@ class SubscriptionService:
         else:
             subscription = Subscription(
                 user_id=user.id,
-                token=generate_token(32),
+                token=issue_subscription_token(user.id) if issue_subscription_token else generate_token(32),
                 expires_at=expires_at,
                 is_active=True,
             )
@@ -87,6 +101,8 @@ class SubscriptionService:
                 },
             )
 
+        if notify_subscription_changes:
+            await notify_subscription_changes(self.session, tokens=[subscription.token], user_ids=[user.id])
         await self.session.commit()
         await self.session.refresh(subscription)
         if ensure_user_enabled and user.is_active and subscription.is_active:
@@ -102,3 +118,9 @@ class SubscriptionService:
 
     def build_subscription_url(self, token: str) -> str:
         return f"{settings.base_sub_url}/{token}"
+
+
+async def close_xui_client() -> None:
+    """Закрыть общий клиент 3X-UI при остановке бота."""
+    if xui_client is not None:
+        await xui_client.close()
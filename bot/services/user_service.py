@@ -1,15 +1,29 @@
 """Работа с пользователями."""
 import logging
+import sys
 import uuid as uuid_pkg
+from pathlib import Path
 
 from sqlalchemy import BigInteger, Boolean, select, String
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Mapped, mapped_column
 
+from bot.config import settings
 from bot.db.session import Base
 
 logger = logging.getLogger(__name__)
 
+BASE_DIR = Path(__file__).resolve().parents[2]
+BACKEND_DIR = BASE_DIR / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.append(str(BACKEND_DIR))
+
+try:
+    from app.services.user_upsert import get_or_create_user
+except Exception:
+    get_or_create_user = None  # type: ignore
+    logger.warning("Upsert пользователей backend недоступен, используем SELECT + INSERT")
+
 
 class User(Base):
     __tablename__ = "users"
@@ -26,6 +40,13 @@ class UserService:
         self.session = session
 
     async def get_or_create_user(self, tg_id: int) -> User:
+        """Пользователь по tg_id; с backend — без гонки при двойном /start."""
+        if get_or_create_user:
+            user, written = await get_or_create_user(self.session, User, tg_id, settings.admin_tg_ids)
+            if written:
+                await self.session.commit()
+            return user
+
         stmt = select(User).where(User.tg_id == tg_id)
         result = await self.session.execute(stmt)
         user = result.scalar_one_or_none()
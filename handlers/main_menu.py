@@ -14,7 +14,7 @@ from services.pg_repo import (
     create_or_extend_subscription,
     days_left,
 )
-from services.backend_api import safe_fetch_subscription
+from services.backend_api import mark_written, safe_fetch_subscription
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -231,6 +231,7 @@ async def vpn_panel_actions(callback: CallbackQuery, state: FSMContext) -> None:
         expires_candidate = _expiry_from_period(period_code)
         async with AsyncSessionLocal() as session:
             record = await create_or_extend_subscription(session, callback.from_user.id, expires_at=expires_candidate)
+        mark_written(callback.from_user.id)
         logger.info(
             "Подписка оформлена через меню",
             extra={
@@ -10,6 +10,7 @@ from dotenv import load_dotenv
 
 from handlers.main_menu import router as main_menu_router
 from handlers.admin_entry import router as admin_router
+from services.pg_repo import close_xui_client
 
 load_dotenv()
 TOKEN = os.getenv("BOT_TOKEN", "None")
@@ -33,7 +34,10 @@ async def main() -> None:
     dp.include_router(main_menu_router)
     dp.include_router(admin_router)
 
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await close_xui_client()
 
 
 if __name__ == "__main__":
@@ -1,17 +1,32 @@
 """HTTP-клиент к backend для получения каноничного статуса подписки."""
 import os
+import time
 from typing import Any, Dict, Optional
 
 import aiohttp
 
 BACKEND_API_URL = os.getenv("BACKEND_API_URL", "http://backend:8000").rstrip("/")
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+
+# tg_id -> до какого момента читать с primary (реплика backend может отставать)
+_recent_writes: Dict[int, float] = {}
+
+
+def mark_written(tg_id: int) -> None:
+    """Подписку пользователя только что изменили: ближайшие запросы — с primary."""
+    now = time.monotonic()
+    for stale_tg_id in [key for key, until in _recent_writes.items() if until <= now]:
+        _recent_writes.pop(stale_tg_id, None)
+    _recent_writes[tg_id] = now + READ_YOUR_WRITES_SECONDS
 
 
 async def fetch_subscription(tg_id: int) -> Dict[str, Any]:
     """Запросить у backend актуальное состояние подписки."""
     url = f"{BACKEND_API_URL}/api/bot/subscription"
     headers = {"X-Bot-Token": BOT_TOKEN}
+    if _recent_writes.get(tg_id, 0) > time.monotonic():
+        headers["X-Read-Primary"] = "true"
     async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as session:
         async with session.post(url, json={"tg_id": tg_id}, headers=headers) as resp:
             if resp.status != 200:
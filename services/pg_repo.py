@@ -26,11 +26,36 @@ if str(BACKEND_DIR) not in sys.path:
     sys.path.append(str(BACKEND_DIR))
 
 try:
+    from app.services.xui_client import xui_client
     from app.services.xui_sync import ensure_user_enabled
 except Exception:
-    ensure_user_enabled = None  # type: ignore
+    ensure_user_enabled = xui_client = None  # type: ignore
     logger.warning("Не удалось импортировать интеграцию с 3X-UI, операции XUI будут пропущены")
 
+try:
+    from app.services.change_notify import notify_subscription_changes
+except Exception:
+    notify_subscription_changes = None  # type: ignore
+    logger.warning("Не удалось импортировать уведомления backend, кэш токенов сбросится только по TTL")
+
+try:
+    from app.services.user_upsert import get_or_create_user
+except Exception:
+    get_or_create_user = None  # type: ignore
+    logger.warning("Upsert пользователей backend недоступен, используем SELECT + INSERT")
+
+try:
+    from app.services.db_pool import PoolOptions, create_pooled_engine
+except Exception:
+    PoolOptions = create_pooled_engine = None  # type: ignore
+    logger.warning("Настройки пула backend недоступны, используем параметры SQLAlchemy по умолчанию")
+
+try:
+    from app.services.token_generator import issue_subscription_token
+except Exception:
+    issue_subscription_token = None  # type: ignore
+    logger.warning("Подпись токенов backend недоступна, выпускаем случайные токены")
+
 
 class Base(DeclarativeBase):
     pass
@@ -40,9 +65,16 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL не задан")
 
-engine = create_async_engine(DATABASE_URL, future=True)
+if create_pooled_engine:
+    # те же DB_POOL_* переменные, что и у backend
+    engine = create_pooled_engine(DATABASE_URL, PoolOptions.from_env(), future=True)
+else:
+    engine = create_async_engine(DATABASE_URL, future=True)
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+# тот же список, что и у backend: роль admin выставляется при первом контакте
+ADMIN_TG_IDS = frozenset(int(part) for part in os.getenv("ADMIN_TG_IDS", "").split(",") if part.strip())
+
 
 class User(Base):
     __tablename__ = "users"
@@ -71,6 +103,12 @@ def _now_utc() -> datetime:
 
 
 async def ensure_user(session: AsyncSession, tg_id: int) -> User:
+    if get_or_create_user:
+        user, written = await get_or_create_user(session, User, tg_id, ADMIN_TG_IDS)
+        if written:
+            await session.commit()
+        return user
+
     stmt = select(User).where(User.tg_id == tg_id)
     result = await session.execute(stmt)
     user = result.scalar_one_or_none()
@@ -101,6 +139,7 @@ async def get_latest_subscription(session: AsyncSession, tg_id: int) -> Optional
         select(Subscription)
         .where(Subscription.user_id == user.id)
         .order_by(Subscription.expires_at.desc())
+        .limit(1)
     )
     result = await session.execute(stmt)
     sub = result.scalars().first()
@@ -135,6 +174,7 @@ async def create_or_extend_subscription(session: AsyncSession, tg_id: int, expir
         select(Subscription)
         .where(Subscription.user_id == user.id)
         .order_by(Subscription.expires_at.desc())
+        .limit(1)
     )
     result = await session.execute(stmt)
     sub = result.scalars().first()
@@ -149,7 +189,7 @@ async def create_or_extend_subscription(session: AsyncSession, tg_id: int, expir
         sub.is_active = True
         action = "extend"
     else:
-        token = secrets.token_urlsafe(32)
+        token = issue_subscription_token(user.id) if issue_subscription_token else secrets.token_urlsafe(32)
         new_expires_at = now + period_delta
         sub = Subscription(
             user_id=user.id,
@@ -160,6 +200,8 @@ async def create_or_extend_subscription(session: AsyncSession, tg_id: int, expir
         session.add(sub)
         action = "create"
 
+    if notify_subscription_changes:
+        await notify_subscription_changes(session, tokens=[sub.token], user_ids=[user.id])
     await session.commit()
     await session.refresh(sub)
     logger.info(
@@ -196,3 +238,9 @@ def days_left(expires_at: str) -> Optional[int]:
     if delta.total_seconds() < 0:
         return 0
     return delta.days + (1 if delta.seconds > 0 else 0)
+
+
+async def close_xui_client() -> None:
+    """Закрыть общий клиент 3X-UI при остановке бота."""
+    if xui_client is not None:
+        await xui_client.close()
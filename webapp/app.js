@@ -2,6 +2,8 @@
 const webApp = window.Telegram?.WebApp;
 const apiBase = window.location.origin; // предполагается тот же домен, что и backend
 const INITDATA_STORAGE_KEY = "tg_initData";
+const SESSION_STORAGE_KEY = "tg_session";
+let sessionToken = sessionStorage.getItem(SESSION_STORAGE_KEY) || "";
 
 const tabsContent = {
   windows: `1) Скачайте v2rayN: https://github.com/2dust/v2rayN/releases
@@ -36,6 +38,12 @@ function setSubscriptionView(data) {
   setStatus(data.status || "inactive");
 }
 
+function rememberSession(token) {
+  if (!token) return;
+  sessionToken = token;
+  sessionStorage.setItem(SESSION_STORAGE_KEY, token);
+}
+
 async function apiPostAuth(initData) {
   const res = await fetch(`${apiBase}/api/auth/telegram`, {
     method: "POST",
@@ -46,16 +54,34 @@ async function apiPostAuth(initData) {
     const text = await res.text();
     throw new Error(`Ошибка аутентификации: ${text}`);
   }
-  return res.json();
+  const data = await res.json();
+  rememberSession(data.session_token);
+  return data;
 }
 
-async function apiGetSubscription(initData) {
-  const res = await fetch(`${apiBase}/api/me/subscription`, {
-    method: "GET",
-    headers: {
-      "X-Telegram-Init-Data": initData,
-    },
-  });
+// Запрос с сессионным токеном; при 401 один раз переавторизуемся по initData
+async function authorizedFetch(url, initData, options = {}, retry = true) {
+  const headers = { ...(options.headers || {}) };
+  if (sessionToken) {
+    headers.Authorization = `Bearer ${sessionToken}`;
+  } else {
+    headers["X-Telegram-Init-Data"] = initData;
+  }
+  const res = await fetch(url, { ...options, headers });
+  rememberSession(res.headers.get("X-Session-Token"));
+  if (res.status === 401 && retry && sessionToken) {
+    sessionToken = "";
+    sessionStorage.removeItem(SESSION_STORAGE_KEY);
+    await apiPostAuth(initData);
+    return authorizedFetch(url, initData, options, false);
+  }
+  return res;
+}
+
+// Роль, профиль и подписка одним запросом: initData проверяется один раз,
+// сессионный токен приходит в заголовке X-Session-Token
+async function apiBootstrap(initData) {
+  const res = await authorizedFetch(`${apiBase}/api/me/bootstrap`, initData, { method: "GET" });
   if (!res.ok) {
     const text = await res.text();
     throw new Error(`Ошибка загрузки подписки: ${text}`);
@@ -142,9 +168,8 @@ async function init() {
   }
 
   try {
-    await apiPostAuth(initData);
-    const sub = await apiGetSubscription(initData);
-    setSubscriptionView(sub);
+    const data = await apiBootstrap(initData);
+    setSubscriptionView(data.subscription);
   } catch (err) {
     showError(err.message || "Ошибка");
   }